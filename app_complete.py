@@ -1,16 +1,30 @@
 import os
-import io
 import json
+import time
+import threading
 import zipfile
 import shutil
+import tempfile
 import logging
+import logging.handlers
+import queue
+import atexit
+import uuid
+import fcntl
+import functools
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from flask import (
-    Flask, request, render_template, jsonify, session,
+    Flask, Request, Response, request, render_template, jsonify, session,
     redirect, url_for, flash, send_file,
 )
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
+import redis
 import requests
+from urllib3.util.retry import Retry
 
 import csv
 import hmac
@@ -18,6 +32,25 @@ import hashlib
 import yaml
 import markdown as md_lib
 
+# libyaml-backed loader when PyYAML was built with it (~10x faster)
+try:
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
+
+# orjson when installed (much faster on multi-KB DRC reports); both
+# helpers work on bytes and raise json.JSONDecodeError subclasses.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+
 from urllib.parse import urlparse
 
 from cas import CASClient
@@ -26,6 +59,7 @@ from datetime import timedelta # for ticket timeout
 
 from compile_queue import CompilationQueue
 from pcb_makefile_generator import create_makefile_for_pcb  # NEW: PCB support
+from drc_report_generator import filter_errors
 
 # =============================================================================
 # ENVIRONMENT / CONFIG VALIDATION
@@ -59,20 +93,55 @@ ROSTER_CSV_PATH = os.environ.get("ROSTER_CSV_PATH", "student_passwords.csv")
 
 UPLOAD_FOLDER = "uploads"
 TEMPLATE_FOLDER = "template_files"
-ALLOWED_CODE_EXTENSIONS = {"c", "h"}
-ALLOWED_PCB_EXTENSIONS = {"kicad_pcb", "kicad_sch", "kicad_pro", "kicad_dru"}  # NEW
-ALLOWED_DOC_EXTENSIONS = {"txt", "pdf"}
+ALLOWED_CODE_EXTENSIONS = frozenset({"c", "h"})
+ALLOWED_PCB_EXTENSIONS = frozenset({"kicad_pcb", "kicad_sch", "kicad_pro", "kicad_dru"})  # NEW
+ALLOWED_DOC_EXTENSIONS = frozenset({"txt", "pdf"})
+# Scratch build directories live beside the uploads so student files can be
+# hard-linked into them and PCB reports renamed back out (neither os.link nor
+# os.replace can cross filesystems).
+BUILD_FOLDER = os.path.abspath(os.path.join(UPLOAD_FOLDER, "_builds"))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(BUILD_FOLDER, exist_ok=True)
 os.makedirs(TEMPLATE_FOLDER, exist_ok=True)
 
+
+def _ext(name):
+    """Lower-cased extension of a filename without the dot ("" if none)."""
+    i = name.rfind(".")
+    return name[i + 1:].lower() if i >= 0 else ""
+
+
+# Configured before anything below logs (load_roster runs at import).
+# Routes only enqueue log records; a background listener does the file and
+# console writes so a slow disk never stalls a request.
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, logging.FileHandler("app.log"), logging.StreamHandler()
+)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(_log_queue)],
+)
+
 # =============================================================================
 # STUDENT ROSTER (loaded from CSV)
 # =============================================================================
 
-# Keyed by netid → { "netid", "name", "canvas_id", "password" }
+# Keyed by netid → { "netid", "name", "canvas_id", "salt", "pw_hash" }
+# Plaintext passwords are never kept in memory — only a salted SHA-256.
 STUDENT_ROSTER = {}
 
+
+def _hash_password(salt, password):
+    """Salted SHA-256 digest of a roster password (fixed 32 bytes)."""
+    return hashlib.sha256(salt + password.encode("utf-8")).digest()
+
+
 def load_roster(csv_path):
     """Load student roster from CSV. Called at startup."""
     global STUDENT_ROSTER
@@ -83,14 +152,27 @@ def load_roster(csv_path):
         return 0
 
     with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            logging.warning("Roster CSV %s is empty — no students can log in!", csv_path)
+            return 0
+
+        col = {name.strip(): i for i, name in enumerate(header)}
+        i_netid, i_name = col["netid"], col["name"]
+        i_canvas_id, i_password = col["canvas_id"], col["password"]
+
         for row in reader:
-            netid = row["netid"].strip().lower()
+            if not row:
+                continue
+            netid = row[i_netid].strip().lower()
+            salt = os.urandom(16)
             STUDENT_ROSTER[netid] = {
                 "netid": netid,
-                "name": row["name"].strip(),
-                "canvas_id": row["canvas_id"].strip(),
-                "password": row["password"].strip(),
+                "name": row[i_name].strip(),
+                "canvas_id": row[i_canvas_id].strip(),
+                "salt": salt,
+                "pw_hash": _hash_password(salt, row[i_password].strip()),
             }
 
     logging.info("Loaded %d students from %s", len(STUDENT_ROSTER), csv_path)
@@ -98,21 +180,27 @@ def load_roster(csv_path):
 
 load_roster(ROSTER_CSV_PATH)
 
+# Used for unknown netids so a miss costs the same hash + compare as a hit.
+_DUMMY_SALT = os.urandom(16)
+_DUMMY_PW_HASH = _hash_password(_DUMMY_SALT, "dummy_password_placeholder")
+
 
 def authenticate_student(netid, password):
     """
     Validate netid + password against the roster.
     Returns the student dict on success, None on failure.
-    Uses constant-time comparison to prevent timing attacks.
+    Uses constant-time comparison of fixed-length digests to prevent
+    timing attacks.
     """
     netid = netid.strip().lower()
     student = STUDENT_ROSTER.get(netid)
     if not student:
-        # Still do a comparison to keep timing constant
-        hmac.compare_digest(password, "dummy_password_placeholder")
+        # Still hash and compare to keep timing constant
+        hmac.compare_digest(_hash_password(_DUMMY_SALT, password), _DUMMY_PW_HASH)
         return None
 
-    if hmac.compare_digest(password, student["password"]):
+    candidate = _hash_password(student["salt"], password)
+    if hmac.compare_digest(candidate, student["pw_hash"]):
         return student
     return None
 
@@ -120,18 +208,45 @@ def authenticate_student(netid, password):
 # FLASK APP
 # =============================================================================
 
+class UploadRequest(Request):
+    """
+    Keep multipart file parts in memory up to MAX_CONTENT_LENGTH instead of
+    Werkzeug's 500 KB spool limit, so a large PCB or PDF is written to disk
+    once (by _save_upload) rather than to a temp file and then copied.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(
+            max_size=app.config["MAX_CONTENT_LENGTH"], mode="rb+"
+        )
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Serialize jsonify() responses (compile status polling, admin queue) with
+    orjson. Falls back to Flask's encoder for types orjson doesn't know.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj, default=self.default, option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 app.secret_key = FLASK_SECRET_KEY
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16 MB
 
 app.permanent_session_lifetime = timedelta(hours=2)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s",
-    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()],
-)
 
 # =============================================================================
 # LAB CONFIGURATION (auto-discovered from template_files/*/lab.yaml)
@@ -166,7 +281,7 @@ def load_lab_configs(template_folder):
 
         try:
             with open(yaml_path, "r") as f:
-                meta = yaml.safe_load(f)
+                meta = yaml.load(f, Loader=YamlSafeLoader)
         except Exception as e:
             logging.error("Failed to parse %s: %s", yaml_path, e)
             continue
@@ -216,10 +331,12 @@ def load_lab_configs(template_folder):
 
         else:
             # ----- Embedded C assignment (original behavior) -----
-            code_files = sorted(
-                f for f in os.listdir(lab_dir)
-                if f.endswith((".c", ".h")) and f != "lab.yaml"
-            )
+            with os.scandir(lab_dir) as entries:
+                code_files = sorted(
+                    entry.name for entry in entries
+                    if _ext(entry.name) in ALLOWED_CODE_EXTENSIONS
+                    and entry.is_file()
+                )
 
             configs[assignment_id] = {
                 "display_name": display_name,
@@ -245,6 +362,32 @@ def load_lab_configs(template_folder):
 
 LAB_CONFIGS = load_lab_configs(TEMPLATE_FOLDER)
 
+# Lab configs are immutable after startup, so derive the per-lab filename
+# set once here rather than on every request.  Kept out of the config dicts
+# themselves so those stay JSON-serializable for the compile queue.
+LAB_KNOWN_FILES = {
+    cfg["template_dir"]: frozenset(cfg["code_files"]) | frozenset(cfg.get("writeup_files", []))
+    for cfg in LAB_CONFIGS.values()
+}
+
+# Files shipped in each lab's template folder (linker script, lab.yaml, …).
+# Templates only change on redeploy, so builds never need to re-list them.
+LAB_TEMPLATE_FILES = {
+    cfg["template_dir"]: frozenset(
+        entry.name
+        for entry in os.scandir(os.path.join(TEMPLATE_FOLDER, cfg["template_dir"]))
+        if entry.is_file()
+    )
+    for cfg in LAB_CONFIGS.values()
+}
+
+# The lab config as the compile queue stores it (job hash field), serialized
+# once instead of on every /compile.
+LAB_CONFIG_JSON = {
+    cfg["template_dir"]: json.dumps(cfg)
+    for cfg in LAB_CONFIGS.values()
+}
+
 # =============================================================================
 # QUEUE CLIENT (NO WORKERS HERE)
 # =============================================================================
@@ -258,13 +401,26 @@ compile_queue = CompilationQueue(
 # HELPERS
 # =============================================================================
 
+# secure_filename is pure, and the same few dozen names recur on every request.
+_secure_filename = functools.lru_cache(maxsize=256)(secure_filename)
+
+
 def allowed_file(filename, exts):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in exts
+    return _ext(filename) in exts
+
+# (student_id, assignment_id) → folder path already created by this process.
+# Upload folders are never removed while the app runs, so each is made once.
+_submission_folders = {}
+
 
 def get_submission_folder(student_id, assignment_id):
     """Return (and create) the per-student, per-assignment upload directory."""
-    path = os.path.join(UPLOAD_FOLDER, f"student_{student_id}", f"assignment_{assignment_id}")
-    os.makedirs(path, exist_ok=True)
+    key = (student_id, assignment_id)
+    path = _submission_folders.get(key)
+    if path is None:
+        path = os.path.join(UPLOAD_FOLDER, f"student_{student_id}", f"assignment_{assignment_id}")
+        os.makedirs(path, exist_ok=True)
+        _submission_folders[key] = path
     return path
 
 def get_template_file_path(lab_template_dir, filename):
@@ -272,112 +428,167 @@ def get_template_file_path(lab_template_dir, filename):
     return os.path.join(TEMPLATE_FOLDER, lab_template_dir, filename)
 
 def get_lab_config_by_assignment_id(assignment_id):
-    return LAB_CONFIGS.get(str(assignment_id))
+    """O(1) lookup in LAB_CONFIGS (keyed by assignment id string)."""
+    # Route args and Redis job fields are already str; only coerce the rest.
+    if type(assignment_id) is not str:
+        assignment_id = str(assignment_id)
+    return LAB_CONFIGS.get(assignment_id)
+
+
+def get_known_files(lab_config):
+    """Template code files + writeup files for this lab, as a frozenset."""
+    return LAB_KNOWN_FILES[lab_config["template_dir"]]
+
+
+ALLOWED_PCB_UPLOAD_EXTENSIONS = ALLOWED_PCB_EXTENSIONS | ALLOWED_DOC_EXTENSIONS
+ALLOWED_CODE_UPLOAD_EXTENSIONS = ALLOWED_CODE_EXTENSIONS | ALLOWED_DOC_EXTENSIONS
+
+# Lab type → allowed upload extensions; anything else is treated as embedded_c.
+_UPLOAD_EXTENSIONS_BY_TYPE = {"kicad_pcb": ALLOWED_PCB_UPLOAD_EXTENSIONS}
 
 
 def get_allowed_extensions(lab_config):
-    """Return the set of allowed file extensions for this lab type."""
-    lab_type = lab_config.get("type", "embedded_c")
-    if lab_type == "kicad_pcb":
-        return ALLOWED_PCB_EXTENSIONS | ALLOWED_DOC_EXTENSIONS
-    else:
-        return ALLOWED_CODE_EXTENSIONS | ALLOWED_DOC_EXTENSIONS
+    """Return the (precomputed) set of allowed file extensions for this lab type."""
+    return _UPLOAD_EXTENSIONS_BY_TYPE.get(lab_config.get("type"), ALLOWED_CODE_UPLOAD_EXTENSIONS)
 
 
 # Extensions where only one file of each type should exist at a time.
 # When a student uploads e.g. a new .kicad_pcb, any existing .kicad_pcb is removed.
-PCB_SINGLETON_EXTENSIONS = {"kicad_pcb", "kicad_sch", "kicad_pro"}
+PCB_SINGLETON_EXTENSIONS = frozenset({"kicad_pcb", "kicad_sch", "kicad_pro"})
+
+
+def _scan_pcb_folder(student_folder, entries=None):
+    """
+    Bucket the student's KiCad project files by extension in one pass.
+
+    Returns {ext: [DirEntry, ...]} for PCB_SINGLETON_EXTENSIONS.  Pass
+    `entries` (from _snapshot_folder) to reuse an existing scan.
+    """
+    if entries is None:
+        entries = _snapshot_folder(student_folder)
+    buckets = {}
+    for fname, entry in entries.items():
+        if fname.startswith("_"):
+            continue
+        ext = _ext(fname)
+        if ext in PCB_SINGLETON_EXTENSIONS and entry.is_file():
+            buckets.setdefault(ext, []).append(entry)
+    return buckets
 
 
-def _remove_existing_pcb_file(student_folder, ext):
+def _remove_existing_pcb_file(student_folder, ext, pcb_files=None):
     """
     Remove any existing file with the given extension from the student folder.
 
     KiCad expects exactly one .kicad_pcb (and matching .kicad_sch / .kicad_pro)
     per project directory.  If a student re-uploads with a different filename,
     the old file must be cleaned up so there's never more than one of each type.
+    Pass `pcb_files` (from _scan_pcb_folder) to reuse an existing scan.
     """
     if ext not in PCB_SINGLETON_EXTENSIONS:
         return
-    if not os.path.isdir(student_folder):
-        return
-    for fname in os.listdir(student_folder):
-        if fname.startswith("_"):
-            continue
-        fext = fname.rsplit(".", 1)[1].lower() if "." in fname else ""
-        if fext == ext:
-            old_path = os.path.join(student_folder, fname)
-            os.remove(old_path)
-            logging.info("Removed previous .%s file: %s", ext, fname)
+    if pcb_files is None:
+        pcb_files = _scan_pcb_folder(student_folder)
+    for entry in pcb_files.get(ext, ()):
+        os.unlink(entry.path)
+        logging.info("Removed previous .%s file: %s", ext, entry.name)
 
 
-def build_uploaded_files_status(student_folder, lab_config):
+def build_uploaded_files_status(student_folder, lab_config, entries=None):
     """
     Build the status dict the assignment template expects.
+    Pass `entries` (from _snapshot_folder) to reuse an existing scan.
 
     For embedded_c: template_files, extra_files, writeup_files
     For kicad_pcb:  pcb_files, writeup_files
     """
-    lab_type = lab_config.get("type", "embedded_c")
+    builder = _STATUS_BUILDERS.get(lab_config.get("type"), _build_embedded_c_files_status)
+    return builder(student_folder, lab_config, entries)
 
-    if lab_type == "kicad_pcb":
-        return _build_pcb_files_status(student_folder, lab_config)
-    else:
-        return _build_embedded_c_files_status(student_folder, lab_config)
 
+def _snapshot_folder(folder):
+    """
+    One os.scandir pass over a folder → {name: DirEntry}.
 
-def _build_embedded_c_files_status(student_folder, lab_config):
+    DirEntry.is_file() is answered from the directory listing and
+    DirEntry.stat() is cached after its first call, so callers can answer
+    every existence / size / mtime question without further syscalls.
+    """
+    try:
+        it = os.scandir(folder)
+    except FileNotFoundError:
+        return {}
+    with it:
+        return {entry.name: entry for entry in it}
+
+
+def _fmt_mtime(ts):
+    """Local "YYYY-MM-DD HH:MM" for an mtime, without building a datetime."""
+    t = time.localtime(ts)
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}"
+
+
+def _writeup_status_from_entries(entries, writeup_files):
+    """Writeup file status shared by both builders, from a _snapshot_folder map."""
+    writeup_status = {}
+    for fname in writeup_files:
+        entry = entries.get(fname)
+        if entry is not None and entry.is_file():
+            stat = entry.stat()
+            writeup_status[fname] = {
+                "uploaded": True,
+                "size": stat.st_size,
+                "modified": _fmt_mtime(stat.st_mtime),
+            }
+        else:
+            writeup_status[fname] = {"uploaded": False, "size": 0, "modified": ""}
+    return writeup_status
+
+
+def _build_embedded_c_files_status(student_folder, lab_config, entries=None):
     """Original embedded C file status builder."""
+    if entries is None:
+        entries = _snapshot_folder(student_folder)
+
     template_status = {}
     for fname in lab_config["code_files"]:
-        fpath = os.path.join(student_folder, fname)
-        excluded_marker = os.path.join(student_folder, fname + ".excluded")
-        if os.path.isfile(fpath):
-            stat = os.stat(fpath)
+        entry = entries.get(fname)
+        if entry is not None and entry.is_file():
+            stat = entry.stat()
             template_status[fname] = {
                 "uploaded": True,
                 "excluded": False,
                 "size": stat.st_size,
-                "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
+                "modified": _fmt_mtime(stat.st_mtime),
             }
         else:
+            marker = entries.get(fname + ".excluded")
             template_status[fname] = {
                 "uploaded": False,
-                "excluded": os.path.isfile(excluded_marker),
+                "excluded": marker is not None and marker.is_file(),
                 "size": 0,
                 "modified": "",
             }
 
     # Discover extra .c/.h files the student added
-    known_files = set(lab_config["code_files"]) | set(lab_config.get("writeup_files", []))
+    known_files = get_known_files(lab_config)
     extra_status = {}
-    if os.path.isdir(student_folder):
-        for fname in sorted(os.listdir(student_folder)):
-            if fname in known_files or fname.endswith(".excluded"):
-                continue
-            if fname.startswith("_"):
-                continue
-            ext = fname.rsplit(".", 1)[1].lower() if "." in fname else ""
-            if ext in ALLOWED_CODE_EXTENSIONS:
-                stat = os.stat(os.path.join(student_folder, fname))
-                extra_status[fname] = {
-                    "size": stat.st_size,
-                    "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
-                }
-
-    # Writeup files
-    writeup_status = {}
-    for fname in lab_config.get("writeup_files", []):
-        fpath = os.path.join(student_folder, fname)
-        if os.path.isfile(fpath):
-            stat = os.stat(fpath)
-            writeup_status[fname] = {
-                "uploaded": True,
+    for fname in sorted(entries):
+        if fname in known_files or fname.endswith(".excluded"):
+            continue
+        if fname.startswith("_"):
+            continue
+        ext = _ext(fname)
+        if ext in ALLOWED_CODE_EXTENSIONS:
+            stat = entries[fname].stat()
+            extra_status[fname] = {
                 "size": stat.st_size,
-                "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
+                "modified": _fmt_mtime(stat.st_mtime),
             }
-        else:
-            writeup_status[fname] = {"uploaded": False, "size": 0, "modified": ""}
+
+    writeup_status = _writeup_status_from_entries(
+        entries, lab_config.get("writeup_files", [])
+    )
 
     return {
         "template_files": template_status,
@@ -386,77 +597,76 @@ def _build_embedded_c_files_status(student_folder, lab_config):
     }
 
 
-def _build_pcb_files_status(student_folder, lab_config):
-    """Build file status for PCB assignments."""
-    pcb_info = {"uploaded": False, "filename": None, "size": 0, "modified": ""}
-    sch_info = {"uploaded": False, "filename": None, "size": 0, "modified": ""}
-    pro_info = {"uploaded": False, "filename": None, "size": 0, "modified": ""}
-
-    if os.path.isdir(student_folder):
-        for fname in os.listdir(student_folder):
-            if fname.startswith("_"):
-                continue
-            ext = fname.rsplit(".", 1)[1].lower() if "." in fname else ""
-            fpath = os.path.join(student_folder, fname)
-            stat = os.stat(fpath)
-            info = {
-                "uploaded": True,
-                "filename": fname,
-                "size": stat.st_size,
-                "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
-            }
-            if ext == "kicad_pcb":
-                pcb_info = info
-            elif ext == "kicad_sch":
-                sch_info = info
-            elif ext == "kicad_pro":
-                pro_info = info
-
-    # Writeup files
-    writeup_status = {}
-    for fname in lab_config.get("writeup_files", []):
-        fpath = os.path.join(student_folder, fname)
-        if os.path.isfile(fpath):
-            stat = os.stat(fpath)
-            writeup_status[fname] = {
-                "uploaded": True,
-                "size": stat.st_size,
-                "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
-            }
-        else:
-            writeup_status[fname] = {"uploaded": False, "size": 0, "modified": ""}
+def _build_pcb_files_status(student_folder, lab_config, entries=None):
+    """
+    Build file status for PCB assignments.
+    Pass `entries` (from _snapshot_folder) to reuse an existing scan.
+    """
+    if entries is None:
+        entries = _snapshot_folder(student_folder)
+    pcb_files = _scan_pcb_folder(student_folder, entries)
+
+    infos = {}
+    for ext in PCB_SINGLETON_EXTENSIONS:
+        if not pcb_files.get(ext):
+            infos[ext] = {"uploaded": False, "filename": None, "size": 0, "modified": ""}
+            continue
+        entry = pcb_files[ext][-1]
+        stat = entry.stat()
+        infos[ext] = {
+            "uploaded": True,
+            "filename": entry.name,
+            "size": stat.st_size,
+            "modified": _fmt_mtime(stat.st_mtime),
+        }
+
+    writeup_status = _writeup_status_from_entries(
+        entries, lab_config.get("writeup_files", [])
+    )
 
     return {
-        "pcb": pcb_info,
-        "sch": sch_info,
-        "pro": pro_info,
+        "pcb": infos["kicad_pcb"],
+        "sch": infos["kicad_sch"],
+        "pro": infos["kicad_pro"],
         "writeup_files": writeup_status,
     }
 
 
-def get_excluded_files(student_folder):
-    """Return set of filenames that the student has excluded."""
-    excluded = set()
-    if os.path.isdir(student_folder):
-        for fname in os.listdir(student_folder):
-            if fname.endswith(".excluded"):
-                excluded.add(fname[:-9])  # strip .excluded
-    return excluded
+# Lab type → status builder; anything else is treated as embedded_c.
+_STATUS_BUILDERS = {"kicad_pcb": _build_pcb_files_status}
 
 
-def get_extra_files(student_folder, lab_config):
-    """Return list of student-added .c/.h filenames not in the template."""
-    known = set(lab_config["code_files"]) | set(lab_config.get("writeup_files", []))
+def get_excluded_files(student_folder, entries=None):
+    """
+    Return set of filenames that the student has excluded.
+    Pass `entries` (from _snapshot_folder) to reuse an existing scan.
+    """
+    if entries is None:
+        entries = _snapshot_folder(student_folder)
+    return {
+        fname[:-9]  # strip .excluded
+        for fname in entries
+        if fname.endswith(".excluded")
+    }
+
+
+def get_extra_files(student_folder, lab_config, entries=None):
+    """
+    Return list of student-added .c/.h filenames not in the template.
+    Pass `entries` (from _snapshot_folder) to reuse an existing scan.
+    """
+    if entries is None:
+        entries = _snapshot_folder(student_folder)
+    known = get_known_files(lab_config)
     extras = []
-    if os.path.isdir(student_folder):
-        for fname in sorted(os.listdir(student_folder)):
-            if fname in known or fname.endswith(".excluded"):
-                continue
-            if fname.startswith("_"):
-                continue
-            ext = fname.rsplit(".", 1)[1].lower() if "." in fname else ""
-            if ext in ALLOWED_CODE_EXTENSIONS:
-                extras.append(fname)
+    for fname in sorted(entries):
+        if fname in known or fname.endswith(".excluded"):
+            continue
+        if fname.startswith("_"):
+            continue
+        ext = _ext(fname)
+        if ext in ALLOWED_CODE_EXTENSIONS:
+            extras.append(fname)
     return extras
 
 
@@ -464,77 +674,218 @@ def get_extra_files(student_folder, lab_config):
 
 COMPILE_STATUS_FILE = "_compile_status.json"
 
-def compute_file_fingerprint(student_folder, lab_config):
+# Saved with each compile status; bump it whenever the fingerprint format
+# changes. Statuses saved before it existed are checked against
+# _legacy_file_fingerprint, so a deploy doesn't reset them to "untested".
+FINGERPRINT_VERSION = 2
+
+def _file_digest(record):
+    """Per-file fingerprint term: a record string hashed to a 64-bit int."""
+    return int.from_bytes(hashlib.blake2b(record.encode(), digest_size=8).digest(), "big")
+
+
+def compute_file_fingerprint(student_folder, lab_config, entries=None):
     """
     Compute a hash representing the current state of all relevant files.
     Any change invalidates the fingerprint.
+    Pass `entries` (from _snapshot_folder) to reuse an existing scan.
+
+    The fingerprint is the XOR of one digest per file, so it is
+    independent of directory order (no sorting) and one file's
+    contribution can be swapped out without touching the others.
     """
     lab_type = lab_config.get("type", "embedded_c")
-    h = hashlib.sha256()
+    if entries is None:
+        entries = _snapshot_folder(student_folder)
+    acc = 0
 
     if lab_type == "kicad_pcb":
         # Hash all PCB-related files
-        if os.path.isdir(student_folder):
-            for fname in sorted(os.listdir(student_folder)):
-                if fname.startswith("_"):
-                    continue
-                ext = fname.rsplit(".", 1)[1].lower() if "." in fname else ""
-                if ext in ALLOWED_PCB_EXTENSIONS or ext in ALLOWED_DOC_EXTENSIONS:
-                    fpath = os.path.join(student_folder, fname)
-                    stat = os.stat(fpath)
-                    h.update(f"{fname}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+        for fname, entry in entries.items():
+            if fname.startswith("_"):
+                continue
+            ext = _ext(fname)
+            if ext in ALLOWED_PCB_UPLOAD_EXTENSIONS:
+                stat = entry.stat()
+                acc ^= _file_digest(f"{fname}:{stat.st_size}:{stat.st_mtime_ns}")
     else:
         # Original embedded_c fingerprinting
-        excluded = get_excluded_files(student_folder)
+        excluded = get_excluded_files(student_folder, entries)
 
         for fname in lab_config["code_files"]:
             if fname in excluded:
-                h.update(f"{fname}:excluded\n".encode())
+                acc ^= _file_digest(f"{fname}:excluded")
             else:
-                fpath = os.path.join(student_folder, fname)
-                if os.path.isfile(fpath):
-                    stat = os.stat(fpath)
-                    h.update(f"{fname}:uploaded:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+                entry = entries.get(fname)
+                if entry is not None and entry.is_file():
+                    stat = entry.stat()
+                    acc ^= _file_digest(f"{fname}:uploaded:{stat.st_size}:{stat.st_mtime_ns}")
                 else:
-                    h.update(f"{fname}:template\n".encode())
+                    acc ^= _file_digest(f"{fname}:template")
+
+        for fname in get_extra_files(student_folder, lab_config, entries):
+            stat = entries[fname].stat()
+            acc ^= _file_digest(f"{fname}:extra:{stat.st_size}:{stat.st_mtime_ns}")
+
+    return acc.to_bytes(8, "big").hex()
+
 
-        for fname in get_extra_files(student_folder, lab_config):
-            fpath = os.path.join(student_folder, fname)
-            stat = os.stat(fpath)
+def _legacy_file_fingerprint(student_folder, lab_config, entries=None):
+    """
+    The fingerprint of statuses saved without a fingerprint_version: one
+    SHA-256 over the file records in order, cut to 16 hex digits.
+    """
+    lab_type = lab_config.get("type", "embedded_c")
+    if entries is None:
+        entries = _snapshot_folder(student_folder)
+    h = hashlib.sha256()
+
+    if lab_type == "kicad_pcb":
+        for fname in sorted(entries):
+            if fname.startswith("_") or _ext(fname) not in ALLOWED_PCB_UPLOAD_EXTENSIONS:
+                continue
+            stat = entries[fname].stat()
+            h.update(f"{fname}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    else:
+        excluded = get_excluded_files(student_folder, entries)
+        for fname in lab_config["code_files"]:
+            entry = entries.get(fname)
+            if fname in excluded:
+                h.update(f"{fname}:excluded\n".encode())
+            elif entry is not None and entry.is_file():
+                stat = entry.stat()
+                h.update(f"{fname}:uploaded:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+            else:
+                h.update(f"{fname}:template\n".encode())
+        for fname in get_extra_files(student_folder, lab_config, entries):
+            stat = entries[fname].stat()
             h.update(f"{fname}:extra:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
 
     return h.hexdigest()[:16]
 
 
+# student_folder → (folder st_mtime_ns, fingerprint).  Any create, delete or
+# rename in the folder bumps its mtime, and uploads are written via rename
+# (see _save_upload), so an unchanged folder mtime means an unchanged
+# fingerprint.
+_fingerprint_cache = {}
+
+# Don't trust a folder mtime this recent: a second change within the same
+# filesystem timestamp tick would leave it unchanged.
+_FINGERPRINT_RACY_NS = 2_000_000_000
+
+
+def current_file_fingerprint(student_folder, lab_config, entries=None):
+    """
+    compute_file_fingerprint, skipped when the folder mtime is unchanged.
+
+    `entries` may come from a scan taken just before this call: the folder
+    mtime is read afterwards, and the racy-mtime guard below keeps a change
+    landing between the two from being cached.
+    """
+    try:
+        folder_mtime_ns = os.stat(student_folder).st_mtime_ns
+    except FileNotFoundError:
+        return compute_file_fingerprint(student_folder, lab_config, entries)
+
+    cached = _fingerprint_cache.get(student_folder)
+    if cached is not None and cached[0] == folder_mtime_ns:
+        return cached[1]
+
+    fingerprint = compute_file_fingerprint(student_folder, lab_config, entries)
+    if time.time_ns() - folder_mtime_ns > _FINGERPRINT_RACY_NS:
+        _fingerprint_cache[student_folder] = (folder_mtime_ns, fingerprint)
+    return fingerprint
+
+
+@contextmanager
+def student_folder_lock(folder):
+    """
+    Exclusive flock on a student folder for multi-step file mutations.
+    flock is kernel-level, so it also serializes across gunicorn workers;
+    uncontended it costs an open, two flocks and a close.
+    """
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+UPLOAD_COPY_BUFSIZE = 1024 * 1024
+
+
+def _save_upload(file, dest):
+    """
+    Save an uploaded file by writing a temp file and renaming it into place.
+    The rename always bumps the folder mtime (an in-place overwrite would
+    not), which keeps current_file_fingerprint's cache honest.
+    """
+    folder, fname = os.path.split(dest)
+    tmp = os.path.join(folder, f"_{fname}.uploading")
+    try:
+        with open(tmp, "wb") as out:
+            shutil.copyfileobj(file.stream, out, UPLOAD_COPY_BUFSIZE)
+        os.replace(tmp, dest)
+    except BaseException:
+        # A client abort or full disk must not leave the partial file behind
+        # for folder scans and the submission zip to pick up
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
 def save_compile_status(student_folder, lab_config, success):
     """Save compile result with current file fingerprint."""
     status = {
         "success": success,
-        "fingerprint": compute_file_fingerprint(student_folder, lab_config),
+        "fingerprint": current_file_fingerprint(student_folder, lab_config),
+        "fingerprint_version": FINGERPRINT_VERSION,
         "timestamp": datetime.utcnow().isoformat(),
     }
     path = os.path.join(student_folder, COMPILE_STATUS_FILE)
-    with open(path, "w") as f:
-        json.dump(status, f)
+    # One write(2) into a private temp file, then rename over the old status
+    # so get_compile_status never sees a half-written file.
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        os.write(fd, _json_dumps(status))
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
 
 
-def get_compile_status(student_folder, lab_config):
+def get_compile_status(student_folder, lab_config, entries=None):
     """
     Return the compile status if it matches the current file state.
+    Pass `entries` (from _snapshot_folder) to reuse an existing scan.
     Returns: "passed", "failed", or "untested"
     """
+    if entries is not None and COMPILE_STATUS_FILE not in entries:
+        return "untested"
     path = os.path.join(student_folder, COMPILE_STATUS_FILE)
-    if not os.path.isfile(path):
+    try:
+        with open(path, "rb") as f:
+            status = _json_loads(f.read())
+    except (FileNotFoundError, json.JSONDecodeError):
         return "untested"
+    version = status.get("fingerprint_version")
     try:
-        with open(path) as f:
-            status = json.load(f)
-        current_fp = compute_file_fingerprint(student_folder, lab_config)
-        if status.get("fingerprint") != current_fp:
+        if version == FINGERPRINT_VERSION:
+            current_fp = current_file_fingerprint(student_folder, lab_config, entries)
+        elif version is None:
+            current_fp = _legacy_file_fingerprint(student_folder, lab_config, entries)
+        else:
             return "untested"
-        return "passed" if status.get("success") else "failed"
-    except (json.JSONDecodeError, KeyError):
+    except KeyError:
+        return "untested"
+    if status.get("fingerprint") != current_fp:
         return "untested"
+    return "passed" if status.get("success") else "failed"
 
 
 def prepare_build_directory(student_folder, lab_config):
@@ -550,44 +901,80 @@ def prepare_build_directory(student_folder, lab_config):
         return _prepare_embedded_c_build_directory(student_folder, lab_config)
 
 
+def _copy_file_range(src, dst):
+    """
+    Copy src to dst with os.copy_file_range, which stays in the kernel and
+    reflinks on filesystems that support it (btrfs, XFS).  Raises OSError
+    (or AttributeError off Linux) when the call isn't usable here.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+    shutil.copystat(src, dst)
+
+
+def _clone_into(src, dst):
+    """Hard-link src to dst, falling back to a kernel-side copy, then copy2.
+
+    Safe for inputs the build only reads: uploads are replaced by rename, so
+    a linked inode is never rewritten underneath a queued build.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        _copy_file_range(src, dst)
+    except (OSError, AttributeError):
+        shutil.copy2(src, dst)
+
+
 def _prepare_embedded_c_build_directory(student_folder, lab_config):
     """Original embedded C build directory preparation."""
-    import tempfile
-
-    build_dir = tempfile.mkdtemp(prefix="dali_build_")
+    build_dir = tempfile.mkdtemp(prefix="dali_build_", dir=BUILD_FOLDER)
     template_dir = lab_config["template_dir"]
-    excluded = get_excluded_files(student_folder)
+    template_full_dir = os.path.join(TEMPLATE_FOLDER, template_dir)
+    template_files = LAB_TEMPLATE_FILES[template_dir]
+
+    # One scan of the student folder answers every "was it uploaded?" check
+    entries = _snapshot_folder(student_folder)
+    excluded = get_excluded_files(student_folder, entries)
+    placed = set()
 
     # Template code files (student upload wins; skip excluded)
     for fname in lab_config["code_files"]:
         if fname in excluded:
             continue
-        student_path = os.path.join(student_folder, fname)
-        template_path = get_template_file_path(template_dir, fname)
-
-        if os.path.isfile(student_path):
-            shutil.copy2(student_path, os.path.join(build_dir, fname))
-        elif os.path.isfile(template_path):
-            shutil.copy2(template_path, os.path.join(build_dir, fname))
+        if fname in entries and entries[fname].is_file():
+            src = entries[fname].path
+        elif fname in template_files:
+            src = os.path.join(template_full_dir, fname)
         else:
             logging.warning("File %s missing from both student dir and templates", fname)
+            continue
+        _clone_into(src, os.path.join(build_dir, fname))
+        placed.add(fname)
 
     # Extra files added by the student
-    for fname in get_extra_files(student_folder, lab_config):
-        shutil.copy2(os.path.join(student_folder, fname), os.path.join(build_dir, fname))
+    for fname in get_extra_files(student_folder, lab_config, entries):
+        if not entries[fname].is_file():
+            continue
+        _clone_into(entries[fname].path, os.path.join(build_dir, fname))
+        placed.add(fname)
 
     # Copy linker script, lab.yaml, and other non-code files from template.
     # Explicitly skip code files that the student excluded — without this
     # check, excluded .c/.h files would get copied back into the build
-    # directory because they don't yet exist there.
-    template_full_dir = os.path.join(TEMPLATE_FOLDER, template_dir)
-    for fname in os.listdir(template_full_dir):
-        dest = os.path.join(build_dir, fname)
-        if os.path.exists(dest):
-            continue
-        if fname in excluded:
+    # directory because they haven't been placed there.
+    for fname in template_files:
+        if fname in placed or fname in excluded:
             continue
-        shutil.copy2(os.path.join(template_full_dir, fname), dest)
+        _clone_into(os.path.join(template_full_dir, fname), os.path.join(build_dir, fname))
 
     return build_dir
 
@@ -597,22 +984,16 @@ def _prepare_pcb_build_directory(student_folder, lab_config):
     Create a temp build directory for a PCB DRC job.
     Copies: student's KiCad files + instructor's DRU files from the template.
     """
-    import tempfile
-
-    build_dir = tempfile.mkdtemp(prefix="dali_pcb_")
+    build_dir = tempfile.mkdtemp(prefix="dali_pcb_", dir=BUILD_FOLDER)
     template_dir = lab_config["template_dir"]
 
     # Copy student's KiCad files
-    if os.path.isdir(student_folder):
-        for fname in os.listdir(student_folder):
-            if fname.startswith("_"):
-                continue
-            ext = fname.rsplit(".", 1)[1].lower() if "." in fname else ""
-            if ext in ALLOWED_PCB_EXTENSIONS:
-                shutil.copy2(
-                    os.path.join(student_folder, fname),
-                    os.path.join(build_dir, fname),
-                )
+    for fname, entry in _snapshot_folder(student_folder).items():
+        if fname.startswith("_"):
+            continue
+        ext = _ext(fname)
+        if ext in ALLOWED_PCB_EXTENSIONS:
+            shutil.copy2(entry.path, os.path.join(build_dir, fname))
 
     # Copy DRU files from template directory
     template_full = os.path.join(TEMPLATE_FOLDER, template_dir)
@@ -626,123 +1007,204 @@ def _prepare_pcb_build_directory(student_folder, lab_config):
     return build_dir
 
 
+# zipfile.ZipFile.write() copies in 8 KiB reads; writeup PDFs are usually the
+# largest entries, so stream every member through a bigger buffer instead.
+ZIP_COPY_BUFSIZE = 1024 * 1024
+
+# Formats that are already compressed; deflating them again burns CPU for
+# no size gain, so they go into the zip stored.
+ZIP_STORED_EXTENSIONS = frozenset({"pdf", "png", "jpg", "jpeg", "zip"})
+
+
+def _zip_write_file(zf, path, arcname, st=None):
+    """
+    Add a file to an open ZipFile, copying with ZIP_COPY_BUFSIZE reads.
+    Pass `st` (e.g. a cached DirEntry.stat()) to skip the os.stat call.
+    Already-compressed formats are stored rather than deflated.
+    """
+    if st is None:
+        st = os.stat(path)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    if _ext(arcname) in ZIP_STORED_EXTENSIONS:
+        zinfo.compress_type = zipfile.ZIP_STORED
+    else:
+        zinfo.compress_type = zf.compression
+    with open(path, "rb") as src, zf.open(zinfo, "w") as dst:
+        shutil.copyfileobj(src, dst, ZIP_COPY_BUFSIZE)
+
+
+# Zips up to this size stay in memory; larger ones roll over to a temp file.
+SUBMISSION_SPOOL_MAX = 4 * 1024 * 1024
+
+
+def _write_submission_zip(members):
+    """Build a spooled zip from (path, arcname, stat) records."""
+    buf = tempfile.SpooledTemporaryFile(max_size=SUBMISSION_SPOOL_MAX, mode="w+b")
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname, st in members:
+            _zip_write_file(zf, path, arcname, st)
+    buf.seek(0)
+    return buf
+
+
 def create_submission_zip(student_folder, lab_config):
     """
-    Build an in-memory zip archive for Canvas submission.
+    Build a zip archive (spooled file object) for Canvas submission.
     Dispatches based on lab type.
     """
     lab_type = lab_config.get("type", "embedded_c")
 
     if lab_type == "kicad_pcb":
-        return _create_pcb_submission_zip(student_folder, lab_config)
+        members = _pcb_submission_entries(student_folder, lab_config)
     else:
-        return _create_embedded_c_submission_zip(student_folder, lab_config)
-
-
-def _create_embedded_c_submission_zip(student_folder, lab_config):
-    """Original embedded C zip builder."""
-    buf = io.BytesIO()
-    template_dir = lab_config["template_dir"]
-    excluded = get_excluded_files(student_folder)
+        members = _embedded_c_submission_entries(student_folder, lab_config)
+    return _write_submission_zip(members)
 
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for fname in lab_config["code_files"]:
-            if fname in excluded:
-                continue
-            student_path = os.path.join(student_folder, fname)
-            template_path = get_template_file_path(template_dir, fname)
 
-            if os.path.isfile(student_path):
-                zf.write(student_path, fname)
-            elif os.path.isfile(template_path):
-                zf.write(template_path, fname)
+def _embedded_c_submission_entries(student_folder, lab_config):
+    """Yield (path, arcname, stat) for an embedded C submission."""
+    entries = _snapshot_folder(student_folder)
+    template_entries = _snapshot_folder(
+        os.path.join(TEMPLATE_FOLDER, lab_config["template_dir"])
+    )
+    excluded = get_excluded_files(student_folder, entries)
 
-        for fname in get_extra_files(student_folder, lab_config):
-            zf.write(os.path.join(student_folder, fname), fname)
+    # Template code files (student upload wins; skip excluded)
+    for fname in lab_config["code_files"]:
+        if fname in excluded:
+            continue
+        entry = entries.get(fname)
+        if entry is None or not entry.is_file():
+            entry = template_entries.get(fname)
+        if entry is not None and entry.is_file():
+            yield entry.path, fname, entry.stat()
 
-        for fname in lab_config.get("writeup_files", []):
-            student_path = os.path.join(student_folder, fname)
-            if os.path.isfile(student_path):
-                zf.write(student_path, fname)
+    # Extra files added by the student
+    for fname in get_extra_files(student_folder, lab_config, entries):
+        yield entries[fname].path, fname, entries[fname].stat()
 
-    buf.seek(0)
-    return buf
+    # Writeups
+    for fname in lab_config.get("writeup_files", []):
+        entry = entries.get(fname)
+        if entry is not None and entry.is_file():
+            yield entry.path, fname, entry.stat()
 
 
-def _create_pcb_submission_zip(student_folder, lab_config):
-    """Build zip with: KiCad files + DRC reports + preview PNGs + writeup."""
-    buf = io.BytesIO()
+def _pcb_submission_entries(student_folder, lab_config):
+    """Yield (path, arcname, stat) for: KiCad files + DRC reports + previews + writeup."""
+    entries = _snapshot_folder(student_folder)
     results_dir = os.path.join(student_folder, "_pcb_results")
 
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        # Student KiCad files
-        if os.path.isdir(student_folder):
-            for fname in os.listdir(student_folder):
-                if fname.startswith("_"):
-                    continue
-                ext = fname.rsplit(".", 1)[1].lower() if "." in fname else ""
-                if ext in ALLOWED_PCB_EXTENSIONS:
-                    zf.write(os.path.join(student_folder, fname), fname)
-
-        # DRC reports and previews from last run
-        if os.path.isdir(results_dir):
-            for fname in os.listdir(results_dir):
-                if fname.endswith((".html", ".json", ".png")):
-                    zf.write(os.path.join(results_dir, fname), fname)
-
-        # Writeup
-        for fname in lab_config.get("writeup_files", []):
-            fpath = os.path.join(student_folder, fname)
-            if os.path.isfile(fpath):
-                zf.write(fpath, fname)
+    # Student KiCad files
+    for fname, entry in entries.items():
+        if fname.startswith("_"):
+            continue
+        ext = _ext(fname)
+        if ext in ALLOWED_PCB_EXTENSIONS:
+            yield entry.path, fname, entry.stat()
 
-    buf.seek(0)
-    return buf
+    # DRC reports and previews from last run
+    for fname, entry in _snapshot_folder(results_dir).items():
+        if fname.endswith((".html", ".json", ".png")):
+            yield entry.path, fname, entry.stat()
+
+    # Writeup
+    for fname in lab_config.get("writeup_files", []):
+        entry = entries.get(fname)
+        if entry is not None and entry.is_file():
+            yield entry.path, fname, entry.stat()
 
 
 # -- PCB results helpers ------------------------------------------------------
 
+# results_dir → ((st_ino, st_mtime_ns), template_dir, results dict).  The
+# worker replaces _pcb_results wholesale (rmtree + fresh copies) after each
+# DRC run, so an unchanged directory inode and mtime means unchanged reports.
+_pcb_results_cache = {}
+
+
 def load_pcb_results(student_folder, lab_config):
     """
     Check for DRC reports and preview PNGs from a previous run.
-    Returns dict for the assignment_pcb.html template.
+    Returns dict for the assignment_pcb.html template (do not mutate it —
+    it is shared by later page views until the results change).
     """
     results_dir = os.path.join(student_folder, "_pcb_results")
-    if not os.path.isdir(results_dir):
+    try:
+        st = os.stat(results_dir)
+    except FileNotFoundError:
         return {"ran": False, "drc_reports": [], "preview_top": False, "preview_bottom": False}
 
+    key = (st.st_ino, st.st_mtime_ns)
+    template_dir = lab_config["template_dir"]
+    cached = _pcb_results_cache.get(results_dir)
+    if cached is not None and cached[0] == key and cached[1] == template_dir:
+        return cached[2]
+
+    pcb_results = _read_pcb_results(results_dir, lab_config)
+    # The worker may still be copying files in; only cache a settled folder.
+    if time.time_ns() - st.st_mtime_ns > _FINGERPRINT_RACY_NS:
+        _pcb_results_cache[results_dir] = (key, template_dir, pcb_results)
+    return pcb_results
+
+
+# DRC JSON reads are independent file reads, so they overlap on a small
+# shared pool rather than running one after another.
+DRC_READ_WORKERS = 4
+_drc_read_pool = ThreadPoolExecutor(max_workers=DRC_READ_WORKERS)
+
+
+def _drc_error_count(json_path):
+    """Number of errors in one DRC JSON report, or None if it can't be read."""
+    try:
+        with open(json_path, "rb") as f:
+            data = _json_loads(f.read())
+        # Same filtering as the report generator
+        return len(filter_errors(data))
+    except Exception:
+        return None
+
+
+def _read_pcb_results(results_dir, lab_config):
+    """Build the load_pcb_results dict from the files in results_dir."""
+    results = _snapshot_folder(results_dir)
+
+    def has_file(name):
+        entry = results.get(name)
+        return entry is not None and entry.is_file()
+
     drc_reports = []
+    pending = []  # (report, json_path) whose error count must be read
     for dru in lab_config.get("dru_files", []):
         slug = os.path.splitext(dru["name"])[0].replace(" ", "_").replace("-", "_")
-        html_path = os.path.join(results_dir, f"drc_{slug}.html")
-        json_path = os.path.join(results_dir, f"drc_{slug}.json")
 
         report = {"label": dru.get("label", dru["name"]), "slug": slug}
 
-        if os.path.isfile(html_path):
+        if has_file(f"drc_{slug}.html"):
             report["html_available"] = True
-            if os.path.isfile(json_path):
-                try:
-                    with open(json_path) as f:
-                        data = json.load(f)
-                    # Import here to use the same logic as the report generator
-                    from drc_report_generator import filter_errors
-                    errors = filter_errors(data)
-                    report["error_count"] = len(errors)
-                    report["passed"] = len(errors) == 0
-                except Exception:
-                    report["passed"] = None
-                    report["error_count"] = None
-            else:
-                report["passed"] = None
-                report["error_count"] = None
+            report["passed"] = None
+            report["error_count"] = None
+            if has_file(f"drc_{slug}.json"):
+                pending.append((report, os.path.join(results_dir, f"drc_{slug}.json")))
         else:
             report["html_available"] = False
 
         drc_reports.append(report)
 
-    preview_top = os.path.isfile(os.path.join(results_dir, "preview_top.png"))
-    preview_bottom = os.path.isfile(os.path.join(results_dir, "preview_bottom.png"))
+    paths = [json_path for _, json_path in pending]
+    if len(paths) > 1:
+        counts = _drc_read_pool.map(_drc_error_count, paths)
+    else:
+        counts = map(_drc_error_count, paths)
+    for (report, _), count in zip(pending, counts):
+        if count is not None:
+            report["error_count"] = count
+            report["passed"] = count == 0
+
+    preview_top = has_file("preview_top.png")
+    preview_bottom = has_file("preview_bottom.png")
 
     return {
         "ran": True,
@@ -756,16 +1218,56 @@ def load_pcb_results(student_folder, lab_config):
 # CANVAS API
 # =============================================================================
 
+# One keep-alive session for all Canvas calls, so page loads reuse an open
+# TLS connection instead of handshaking each time.  The pool is sized for
+# request threads plus submit_pool workers hitting Canvas at once.
+# Failed connects are retried with backoff for any method, since Canvas never
+# saw the request.  Gateway errors and read timeouts are retried for GETs
+# only: a PUT or POST may already have been applied.
+CANVAS_POOL_SIZE = int(os.environ.get("CANVAS_POOL_SIZE", "32"))
+
+# (connect, read) seconds: fail fast when Canvas is unreachable, but give
+# slow pages and uploads time to finish.
+CANVAS_TIMEOUT = (3.05, 30)
+CANVAS_UPLOAD_TIMEOUT = (3.05, 60)
+
+# Sent per call rather than set on the session: the file-upload POST goes
+# to a storage host that must not receive the API token.
+_CANVAS_HEADERS = {"Authorization": f"Bearer {CANVAS_API_TOKEN}"}
+
+_canvas_session = requests.Session()
+_canvas_session.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(
+        pool_maxsize=CANVAS_POOL_SIZE,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Assignment metadata changes rarely; GETs made while rendering pages are
+# served from this cache for CANVAS_CACHE_TTL seconds.
+CANVAS_CACHE_TTL = int(os.environ.get("CANVAS_CACHE_TTL", "60"))
+
+# endpoint → (expires_at monotonic seconds, response body)
+_canvas_get_cache = {}
+
+
 def canvas_api_request(endpoint, method="GET", data=None, files=None):
     url = f"{CANVAS_BASE_URL}/api/v1/{endpoint}"
-    headers = {"Authorization": f"Bearer {CANVAS_API_TOKEN}"}
+    headers = _CANVAS_HEADERS
 
     if method == "GET":
         # Fetch all pages (Canvas paginates list endpoints via Link headers)
         results = []
         next_url = url
         while next_url:
-            r = requests.get(next_url, headers=headers, timeout=30)
+            r = _canvas_session.get(next_url, headers=headers, timeout=CANVAS_TIMEOUT)
             r.raise_for_status()
             body = r.json()
             if isinstance(body, list):
@@ -776,17 +1278,60 @@ def canvas_api_request(endpoint, method="GET", data=None, files=None):
         return results
     elif method == "POST":
         if files:
-            r = requests.post(url, headers=headers, data=data, files=files, timeout=60)
+            r = _canvas_session.post(
+                url, headers=headers, data=data, files=files, timeout=CANVAS_UPLOAD_TIMEOUT
+            )
         else:
-            r = requests.post(url, headers=headers, json=data, timeout=30)
+            r = _canvas_session.post(url, headers=headers, json=data, timeout=CANVAS_TIMEOUT)
     elif method == "PUT":
-        r = requests.put(url, headers=headers, json=data, timeout=30)
+        r = _canvas_session.put(url, headers=headers, json=data, timeout=CANVAS_TIMEOUT)
     else:
         raise ValueError("Unsupported method")
 
     r.raise_for_status()
     return r.json()
 
+
+def canvas_get_cached(endpoint):
+    """
+    GET a Canvas endpoint, reusing a response younger than CANVAS_CACHE_TTL.
+    Responses are shared between gunicorn workers through Redis (when up) and
+    kept in-process until the Redis copy expires.  Only successful responses
+    are cached.  Callers must not mutate the result.
+    """
+    now = time.monotonic()
+    hit = _canvas_get_cache.get(endpoint)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+
+    # The shared tier is best effort: the health flag can lag a Redis
+    # outage, and pages must keep rendering straight from Canvas meanwhile
+    key = f"canvas_cache:{endpoint}"
+    use_redis = compile_queue.is_available()
+    if use_redis:
+        try:
+            pipe = compile_queue.redis.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, ttl_ms = pipe.execute()
+        except redis.RedisError as e:
+            logging.warning("Canvas cache read failed for %s: %s", endpoint, e)
+            use_redis = False
+        else:
+            if raw is not None and ttl_ms > 0:
+                body = _json_loads(raw)
+                _canvas_get_cache[endpoint] = (now + ttl_ms / 1000, body)
+                return body
+
+    body = canvas_api_request(endpoint)
+    if use_redis:
+        try:
+            compile_queue.redis.set(key, _json_dumps(body), ex=CANVAS_CACHE_TTL)
+        except redis.RedisError as e:
+            logging.warning("Canvas cache write failed for %s: %s", endpoint, e)
+    _canvas_get_cache[endpoint] = (now + CANVAS_CACHE_TTL, body)
+    return body
+
 # =============================================================================
 # ROUTES – AUTH
 # =============================================================================
@@ -864,13 +1409,17 @@ def logout():
     return redirect(url_for("login"))
 
 
+# Endpoints that never need a roster check (None = unmatched URL / 404).
+_SESSION_EXEMPT_ENDPOINTS = frozenset({
+    "login", "login_cas", "cas_callback", "login_password",
+    "logout", "health", "admin_login", "static", None,
+})
+
+
 @app.before_request
 def validate_session():
     """Check that the logged-in student is still in the roster."""
-    if request.endpoint in (
-        "login", "login_cas", "cas_callback", "login_password",
-        "logout", "health", "admin_login", "static", None
-    ):
+    if request.endpoint in _SESSION_EXEMPT_ENDPOINTS:
         return
 
     netid = session.get("netid")
@@ -892,7 +1441,7 @@ def validate_session():
 def home():
     if "student_id" not in session:
         return redirect(url_for("login"))
-    all_assignments = canvas_api_request(f"courses/{COURSE_ID}/assignments")
+    all_assignments = canvas_get_cached(f"courses/{COURSE_ID}/assignments")
     assignments = [a for a in all_assignments if str(a["id"]) in LAB_CONFIGS]
     return render_template(
         "home_api.html",
@@ -905,7 +1454,7 @@ def assignment(assignment_id):
     if "student_id" not in session:
         return redirect(url_for("login"))
 
-    assignment_data = canvas_api_request(
+    assignment_data = canvas_get_cached(
         f"courses/{COURSE_ID}/assignments/{assignment_id}"
     )
     lab = get_lab_config_by_assignment_id(assignment_id)
@@ -915,7 +1464,9 @@ def assignment(assignment_id):
         return redirect(url_for("home"))
 
     student_folder = get_submission_folder(session["student_id"], assignment_id)
-    file_status = build_uploaded_files_status(student_folder, lab)
+    # One directory scan serves both the file list and the compile state
+    entries = _snapshot_folder(student_folder)
+    file_status = build_uploaded_files_status(student_folder, lab, entries)
 
     instructions_raw = lab.get("instructions", "")
     instructions_html = md_lib.markdown(instructions_raw) if instructions_raw else ""
@@ -923,7 +1474,7 @@ def assignment(assignment_id):
     pre_compile_raw = lab.get("pre_compile_text", "")
     pre_compile_html = md_lib.markdown(pre_compile_raw) if pre_compile_raw else ""
 
-    compile_state = get_compile_status(student_folder, lab)
+    compile_state = get_compile_status(student_folder, lab, entries)
     scoring = lab.get("scoring") or {}
     lab_type = lab.get("type", "embedded_c")
 
@@ -1001,30 +1552,35 @@ def upload_file(assignment_id, filename):
         return jsonify(error="Empty filename"), 400
 
     # Validate extension based on lab type
-    ext = filename.rsplit(".", 1)[1].lower() if "." in filename else ""
+    ext = _ext(filename)
     allowed = get_allowed_extensions(lab)
     if ext not in allowed:
         return jsonify(error=f"File type .{ext} not allowed"), 400
 
-    filename = secure_filename(filename)
+    filename = _secure_filename(filename)
     if not filename:
         return jsonify(error="Invalid filename"), 400
 
     student_folder = get_submission_folder(session["student_id"], assignment_id)
 
-    # For PCB labs, ensure only one file per KiCad type exists at a time.
-    # If the student uploads a new .kicad_pcb with a different name than the
-    # previous one, remove the old one first.
-    if lab.get("type") == "kicad_pcb":
-        _remove_existing_pcb_file(student_folder, ext)
-
     dest = os.path.join(student_folder, filename)
-    file.save(dest)
-
-    # If this was an excluded template file being re-uploaded, remove the marker
-    excluded_marker = dest + ".excluded"
-    if os.path.isfile(excluded_marker):
-        os.remove(excluded_marker)
+    with student_folder_lock(student_folder):
+        # For PCB labs, ensure only one file per KiCad type exists at a time.
+        # If the student uploads a new .kicad_pcb with a different name than the
+        # previous one, remove the old one first.
+        if lab.get("type") == "kicad_pcb":
+            _remove_existing_pcb_file(student_folder, ext)
+
+        _save_upload(file, dest)
+
+        # If this was an excluded template file being re-uploaded, remove the
+        # marker.  exclude_file only ever marks template code files, so nothing
+        # else can have one and the unlink would just miss.
+        if filename in lab["code_files"]:
+            try:
+                os.remove(dest + ".excluded")
+            except FileNotFoundError:
+                pass
 
     logging.info(
         "Student %s uploaded %s for assignment %s",
@@ -1050,11 +1606,11 @@ def upload_extra_file(assignment_id):
     if file.filename == "":
         return jsonify(error="Empty filename"), 400
 
-    filename = secure_filename(file.filename)
+    filename = _secure_filename(file.filename)
     if not filename:
         return jsonify(error="Invalid filename"), 400
 
-    ext = filename.rsplit(".", 1)[1].lower() if "." in filename else ""
+    ext = _ext(filename)
 
     # For embedded_c, only .c/.h; for PCB, use PCB extensions
     lab_type = lab.get("type", "embedded_c")
@@ -1067,12 +1623,13 @@ def upload_extra_file(assignment_id):
 
     student_folder = get_submission_folder(session["student_id"], assignment_id)
 
-    # For PCB labs, ensure only one file per KiCad type
-    if lab_type == "kicad_pcb":
-        _remove_existing_pcb_file(student_folder, ext)
-
     dest = os.path.join(student_folder, filename)
-    file.save(dest)
+    with student_folder_lock(student_folder):
+        # For PCB labs, ensure only one file per KiCad type
+        if lab_type == "kicad_pcb":
+            _remove_existing_pcb_file(student_folder, ext)
+
+        _save_upload(file, dest)
 
     logging.info(
         "Student %s uploaded extra file %s for assignment %s",
@@ -1097,16 +1654,17 @@ def revert_file(assignment_id, filename):
     student_folder = get_submission_folder(session["student_id"], assignment_id)
     fpath = os.path.join(student_folder, filename)
 
-    if os.path.isfile(fpath):
+    try:
         os.remove(fpath)
-        logging.info(
-            "Student %s reverted %s for assignment %s",
-            session.get("netid"), filename, assignment_id,
-        )
-        return jsonify(success=True, message=f"{filename} reverted to template default.")
-    else:
+    except FileNotFoundError:
         return jsonify(success=True, message=f"{filename} was already using the template default.")
 
+    logging.info(
+        "Student %s reverted %s for assignment %s",
+        session.get("netid"), filename, assignment_id,
+    )
+    return jsonify(success=True, message=f"{filename} reverted to template default.")
+
 
 @app.route("/exclude/<assignment_id>/<filename>", methods=["POST"])
 def exclude_file(assignment_id, filename):
@@ -1123,13 +1681,14 @@ def exclude_file(assignment_id, filename):
 
     student_folder = get_submission_folder(session["student_id"], assignment_id)
 
-    fpath = os.path.join(student_folder, filename)
-    if os.path.isfile(fpath):
-        os.remove(fpath)
-
     marker = os.path.join(student_folder, filename + ".excluded")
-    with open(marker, "w") as f:
-        f.write("")
+    with student_folder_lock(student_folder):
+        # Turn the student's upload (if any) into the marker in one rename;
+        # only the marker's name matters, never its contents.
+        try:
+            os.rename(os.path.join(student_folder, filename), marker)
+        except FileNotFoundError:
+            open(marker, "w").close()
 
     logging.info(
         "Student %s excluded %s for assignment %s",
@@ -1152,10 +1711,10 @@ def restore_file(assignment_id, filename):
         return jsonify(error="Can only restore template files"), 400
 
     student_folder = get_submission_folder(session["student_id"], assignment_id)
-    marker = os.path.join(student_folder, filename + ".excluded")
-
-    if os.path.isfile(marker):
-        os.remove(marker)
+    try:
+        os.remove(os.path.join(student_folder, filename + ".excluded"))
+    except FileNotFoundError:
+        pass
 
     logging.info(
         "Student %s restored %s for assignment %s",
@@ -1177,20 +1736,52 @@ def delete_extra_file(assignment_id, filename):
     if filename in lab["code_files"] or filename in lab.get("writeup_files", []):
         return jsonify(error="Use revert for template files"), 400
 
-    filename = secure_filename(filename)
+    filename = _secure_filename(filename)
     student_folder = get_submission_folder(session["student_id"], assignment_id)
     fpath = os.path.join(student_folder, filename)
 
-    if os.path.isfile(fpath):
+    # IsADirectoryError: the name matched a subfolder such as _pcb_results
+    try:
         os.remove(fpath)
-        logging.info(
-            "Student %s deleted extra file %s for assignment %s",
-            session.get("netid"), filename, assignment_id,
-        )
-        return jsonify(success=True, message=f"{filename} deleted.")
-    else:
+    except (FileNotFoundError, IsADirectoryError):
         return jsonify(error="File not found"), 404
 
+    logging.info(
+        "Student %s deleted extra file %s for assignment %s",
+        session.get("netid"), filename, assignment_id,
+    )
+    return jsonify(success=True, message=f"{filename} deleted.")
+
+
+# Text formats the code viewer can show (KiCad files are S-expression/JSON
+# text); anything else, e.g. a PDF writeup, is never decoded.
+VIEWABLE_EXTENSIONS = ALLOWED_CODE_EXTENSIONS | ALLOWED_PCB_EXTENSIONS | {"txt", "md"}
+VIEW_MAX_BYTES = 512 * 1024
+
+
+def _read_for_view(fpath):
+    """Read at most VIEW_MAX_BYTES of a text file for the viewer template."""
+    with open(fpath, "rb") as f:
+        data = f.read(VIEW_MAX_BYTES + 1)
+    if len(data) <= VIEW_MAX_BYTES:
+        return data.decode("utf-8", errors="replace")
+    content = data[:VIEW_MAX_BYTES].decode("utf-8", errors="replace")
+    return content + f"\n\n… (truncated — showing the first {VIEW_MAX_BYTES // 1024} KB)"
+
+
+@functools.lru_cache(maxsize=128)
+def _template_content(lab_name, filename):
+    """Viewer text for a template file, or None if it doesn't exist.
+
+    Templates only change on redeploy, so the read is cached per process.
+    """
+    if _ext(filename) not in VIEWABLE_EXTENSIONS:
+        return None
+    try:
+        return _read_for_view(get_template_file_path(lab_name, filename))
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+
 
 @app.route("/view/<assignment_id>/<filename>")
 def view_file(assignment_id, filename):
@@ -1203,6 +1794,10 @@ def view_file(assignment_id, filename):
         flash("Unknown assignment")
         return redirect(url_for("home"))
 
+    if _ext(filename) not in VIEWABLE_EXTENSIONS:
+        flash("This file type can't be previewed")
+        return redirect(url_for("assignment", assignment_id=assignment_id))
+
     student_folder = get_submission_folder(session["student_id"], assignment_id)
     fpath = os.path.join(student_folder, filename)
 
@@ -1210,8 +1805,7 @@ def view_file(assignment_id, filename):
         flash("File not found")
         return redirect(url_for("assignment", assignment_id=assignment_id))
 
-    with open(fpath, "r", errors="replace") as f:
-        content = f.read()
+    content = _read_for_view(fpath)
 
     return render_template("view_file.html", filename=filename, content=content)
 
@@ -1222,18 +1816,14 @@ def view_template(lab_name, filename):
     if "student_id" not in session:
         return redirect(url_for("login"))
 
-    lab_name = secure_filename(lab_name)
-    filename = secure_filename(filename)
-
-    fpath = get_template_file_path(lab_name, filename)
+    lab_name = _secure_filename(lab_name)
+    filename = _secure_filename(filename)
 
-    if not os.path.isfile(fpath):
+    content = _template_content(lab_name, filename)
+    if content is None:
         flash("Template file not found")
         return redirect(url_for("home"))
 
-    with open(fpath, "r", errors="replace") as f:
-        content = f.read()
-
     return render_template("view_file.html", filename=f"{filename} (template)", content=content)
 
 # =============================================================================
@@ -1251,9 +1841,12 @@ def pcb_preview(assignment_id, side):
     student_folder = get_submission_folder(session["student_id"], assignment_id)
     img_path = os.path.join(student_folder, "_pcb_results", f"preview_{side}.png")
 
-    if not os.path.isfile(img_path):
+    # conditional + max_age=0: the browser revalidates each view and gets a
+    # bodyless 304 until a new DRC run replaces the file.
+    try:
+        return send_file(img_path, mimetype="image/png", conditional=True, max_age=0)
+    except FileNotFoundError:
         return "Not found", 404
-    return send_file(img_path, mimetype="image/png")
 
 
 @app.route("/pcb-results/<assignment_id>/drc/<slug>.html")
@@ -1262,13 +1855,14 @@ def pcb_drc_report(assignment_id, slug):
     if "student_id" not in session:
         return redirect(url_for("login"))
 
-    slug = secure_filename(slug)
+    slug = _secure_filename(slug)
     student_folder = get_submission_folder(session["student_id"], assignment_id)
     html_path = os.path.join(student_folder, "_pcb_results", f"drc_{slug}.html")
 
-    if not os.path.isfile(html_path):
+    try:
+        return send_file(html_path, mimetype="text/html", conditional=True, max_age=0)
+    except FileNotFoundError:
         return "Not found", 404
-    return send_file(html_path, mimetype="text/html")
 
 # =============================================================================
 # CANVAS FILE UPLOAD HELPERS
@@ -1288,12 +1882,14 @@ def _canvas_upload_file(preflight_url, filename, zip_buf, as_user_id=None):
     Returns the file_id of the newly created Canvas file.
     """
     # Step 1: Preflight (NO as_user_id parameter)
+    zip_buf.seek(0, os.SEEK_END)
+    zip_size = zip_buf.tell()
     preflight = canvas_api_request(
         preflight_url,
         method="POST",
         data={
             "name": filename,
-            "size": zip_buf.getbuffer().nbytes,
+            "size": zip_size,
             "content_type": "application/zip",
         },
     )
@@ -1303,11 +1899,11 @@ def _canvas_upload_file(preflight_url, filename, zip_buf, as_user_id=None):
 
     # Step 2: Upload the actual file
     zip_buf.seek(0)
-    resp = requests.post(
+    resp = _canvas_session.post(
         upload_url,
         data=upload_params,
         files={"file": (filename, zip_buf, "application/zip")},
-        timeout=60,
+        timeout=CANVAS_UPLOAD_TIMEOUT,
         allow_redirects=False,  # CRITICAL: Don't auto-follow redirects
     )
 
@@ -1427,81 +2023,53 @@ def _create_submission(assignment_id, student_id, file_id, timestamp):
     )
 
 
-def _attach_comment(assignment_id, student_id, file_id, timestamp):
-    """Attach a file as a submission comment (original behavior)."""
+def _attach_comment(assignment_id, student_id, file_id, timestamp, score=None):
+    """
+    Attach a file as a submission comment (original behavior).
+    If `score` is given it is posted in the same PUT.
+    """
+    data = {
+        "comment": {
+            "text_comment": f"Submitted via DALI at {timestamp}",
+            "file_ids": [file_id],
+        }
+    }
+    if score is not None:
+        data["submission"] = {"posted_grade": score}
     canvas_api_request(
         f"courses/{COURSE_ID}/assignments/{assignment_id}"
         f"/submissions/{student_id}",
         method="PUT",
-        data={
-            "comment": {
-                "text_comment": f"Submitted via DALI at {timestamp}",
-                "file_ids": [file_id],
-            }
-        },
+        data=data,
     )
 
 # =============================================================================
-# ROUTES – SUBMISSION
+# BACKGROUND SUBMISSION
 # =============================================================================
 
-@app.route("/submit/<assignment_id>", methods=["POST"])
-def submit(assignment_id):
-    """
-    Build a zip of template + student files, then upload it to Canvas.
-
-    If SUBMIT_AS_UPLOAD is True (default), this creates an actual Canvas
-    submission of type online_upload, so the zip appears in SpeedGrader
-    as the student's submission — not just a comment.
-
-    If SUBMIT_AS_UPLOAD is False, falls back to the original behavior of
-    uploading the zip as a submission comment attachment.
-    """
-    if "student_id" not in session:
-        return jsonify(error="Not authenticated"), 403
+SUBMIT_WORKERS = int(os.environ.get("SUBMIT_WORKERS", "4"))
+SUBMISSION_STATUS_TTL = 3600  # seconds to keep submission:<id> around for polling
+# An upload still "uploading" after this long is presumed lost (e.g. its
+# gunicorn worker was restarted); the record expires and the page gives up.
+SUBMISSION_PENDING_TTL = 600
 
-    lab = get_lab_config_by_assignment_id(assignment_id)
-    if not lab:
-        return jsonify(error="Unknown assignment"), 400
+submit_pool = ThreadPoolExecutor(max_workers=SUBMIT_WORKERS)
 
-    student_folder = get_submission_folder(session["student_id"], assignment_id)
 
-    # Require at least one writeup file (only if the lab expects writeups)
-    writeup_files = lab.get("writeup_files", [])
-    if writeup_files:
-        has_writeup = any(
-            os.path.isfile(os.path.join(student_folder, wf))
-            for wf in writeup_files
-        )
-        if not has_writeup:
-            return jsonify(error="Please upload a writeup file before submitting."), 400
-
-    # For PCB labs, require a .kicad_pcb file
-    lab_type = lab.get("type", "embedded_c")
-    if lab_type == "kicad_pcb":
-        has_pcb = any(
-            f.endswith(".kicad_pcb")
-            for f in os.listdir(student_folder)
-            if not f.startswith("_")
-        )
-        if not has_pcb:
-            return jsonify(error="Please upload a .kicad_pcb file before submitting."), 400
+def _do_submission(assignment_id, student_id, netid, student_folder, lab):
+    """
+    Zip the student's files, upload them to Canvas, and post a score if
+    the lab has scoring configured.
 
+    Runs outside the request context (no session access).  Returns a dict
+    with either {"success": True, "message": ...} or
+    {"success": False, "error": ...}.
+    """
     try:
-        zip_buf = create_submission_zip(student_folder, lab)
-        netid = session.get("netid", session["student_id"])
         zip_filename = f"{lab['display_name'].replace(' ', '_')}_{netid}.zip"
-        student_id = session["student_id"]
-        timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
+        timestamp = time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime())
 
-        if SUBMIT_AS_UPLOAD:
-            file_id = _upload_submission_file(assignment_id, student_id, zip_filename, zip_buf)
-            _create_submission(assignment_id, student_id, file_id, timestamp)
-        else:
-            file_id = _upload_comment_file(assignment_id, student_id, zip_filename, zip_buf)
-            _attach_comment(assignment_id, student_id, file_id, timestamp)
-
-        # ---- Post score if scoring is configured ----
+        # ---- Score to post, if scoring is configured ----
         scoring = lab.get("scoring")
         score = None
         if scoring:
@@ -1511,7 +2079,18 @@ def submit(assignment_id):
             elif "submit_score" in scoring:
                 score = scoring["submit_score"]
 
-        if score is not None:
+        with create_submission_zip(student_folder, lab) as zip_buf:
+            if SUBMIT_AS_UPLOAD:
+                file_id = _upload_submission_file(assignment_id, student_id, zip_filename, zip_buf)
+                _create_submission(assignment_id, student_id, file_id, timestamp)
+            else:
+                # The comment PUT carries the grade too — no extra round trip.
+                file_id = _upload_comment_file(assignment_id, student_id, zip_filename, zip_buf)
+                _attach_comment(assignment_id, student_id, file_id, timestamp, score)
+
+        # The create-submission POST can't carry a grade, so upload mode
+        # still posts it with a separate PUT.
+        if score is not None and SUBMIT_AS_UPLOAD:
             try:
                 canvas_api_request(
                     f"courses/{COURSE_ID}/assignments/{assignment_id}"
@@ -1541,7 +2120,7 @@ def submit(assignment_id):
         msg = "Submitted successfully to Canvas!"
         if score is not None:
             msg += f" Score: {score}"
-        return jsonify(success=True, message=msg)
+        return {"success": True, "message": msg}
 
     except requests.exceptions.HTTPError as e:
         error_body = ""
@@ -1552,13 +2131,125 @@ def submit(assignment_id):
                 error_body = e.response.text[:500]
         logging.error(
             "Canvas API error for student %s on assignment %s: %s — %s",
-            session.get("netid"), assignment_id, e, error_body,
+            netid, assignment_id, e, error_body,
         )
-        return jsonify(error=f"Canvas rejected the submission: {e}"), 500
+        return {"success": False, "error": f"Canvas rejected the submission: {e}"}
 
     except Exception as e:
-        logging.error("Submission failed for student %s: %s", session.get("netid"), e)
-        return jsonify(error=f"Submission failed: {str(e)}"), 500
+        logging.error("Submission failed for student %s: %s", netid, e)
+        return {"success": False, "error": f"Submission failed: {str(e)}"}
+
+
+def _run_submission_job(submission_id, job_args):
+    """submit_pool entry point: run the submission and record its outcome."""
+    result = _do_submission(*job_args)
+    key = f"submission:{submission_id}"
+    try:
+        pipe = compile_queue.redis.pipeline()
+        pipe.hset(key, mapping={
+            "status": "complete" if result["success"] else "failed",
+            "message": result.get("message", ""),
+            "error": result.get("error", ""),
+        })
+        pipe.expire(key, SUBMISSION_STATUS_TTL)
+        pipe.execute()
+    except Exception:
+        logging.exception("Could not record outcome of submission %s", submission_id)
+
+# =============================================================================
+# ROUTES – SUBMISSION
+# =============================================================================
+
+@app.route("/submit/<assignment_id>", methods=["POST"])
+def submit(assignment_id):
+    """
+    Build a zip of template + student files, then upload it to Canvas.
+
+    If SUBMIT_AS_UPLOAD is True (default), this creates an actual Canvas
+    submission of type online_upload, so the zip appears in SpeedGrader
+    as the student's submission — not just a comment.
+
+    If SUBMIT_AS_UPLOAD is False, falls back to the original behavior of
+    uploading the zip as a submission comment attachment.
+
+    When Redis is available the upload runs on submit_pool and this route
+    returns 202 with a submission_id to poll via /submission-status/<id>.
+    """
+    if "student_id" not in session:
+        return jsonify(error="Not authenticated"), 403
+
+    lab = get_lab_config_by_assignment_id(assignment_id)
+    if not lab:
+        return jsonify(error="Unknown assignment"), 400
+
+    student_folder = get_submission_folder(session["student_id"], assignment_id)
+    entries = _snapshot_folder(student_folder)
+
+    # Require at least one writeup file (only if the lab expects writeups)
+    writeup_files = lab.get("writeup_files", [])
+    if writeup_files:
+        has_writeup = not entries.keys().isdisjoint(writeup_files)
+        if not has_writeup:
+            return jsonify(error="Please upload a writeup file before submitting."), 400
+
+    # For PCB labs, require a .kicad_pcb file
+    lab_type = lab.get("type", "embedded_c")
+    if lab_type == "kicad_pcb":
+        has_pcb = "kicad_pcb" in _scan_pcb_folder(student_folder, entries)
+        if not has_pcb:
+            return jsonify(error="Please upload a .kicad_pcb file before submitting."), 400
+
+    student_id = session["student_id"]
+    netid = session.get("netid", student_id)
+    job_args = (assignment_id, student_id, netid, student_folder, lab)
+
+    if not compile_queue.is_available():
+        # No shared store to report progress through — upload inline.
+        result = _do_submission(*job_args)
+        return jsonify(result), (200 if result["success"] else 500)
+
+    # Hand the zip + Canvas round-trips to the background pool and return
+    # immediately; the browser polls /submission-status/<id> for the outcome.
+    submission_id = str(uuid.uuid4())
+    key = f"submission:{submission_id}"
+    pipe = compile_queue.redis.pipeline()
+    pipe.hset(key, mapping={
+        "status": "uploading",
+        "student_id": student_id,
+        "assignment_id": assignment_id,
+    })
+    pipe.expire(key, SUBMISSION_PENDING_TTL)
+    pipe.execute()
+    submit_pool.submit(_run_submission_job, submission_id, job_args)
+
+    return jsonify(
+        success=True,
+        pending=True,
+        submission_id=submission_id,
+        poll_timeout=SUBMISSION_PENDING_TTL,
+        message="Uploading to Canvas…",
+    ), 202
+
+
+@app.route("/submission-status/<submission_id>")
+def submission_status(submission_id):
+    """Poll the outcome of a background submission started by /submit."""
+    if "student_id" not in session:
+        return jsonify(error="Not authenticated"), 403
+    if not compile_queue.is_available():
+        return jsonify(error="Not found"), 404
+
+    data = compile_queue.redis.hgetall(f"submission:{submission_id}")
+    if not data or data.get("student_id") != session["student_id"]:
+        return jsonify(error="Not found"), 404
+
+    status = data.get("status", "uploading")
+    return jsonify(
+        status=status,
+        success=status == "complete",
+        message=data.get("message", ""),
+        error=data.get("error", ""),
+    )
 
 # =============================================================================
 # ROUTES – COMPILATION / DRC
@@ -1571,7 +2262,7 @@ def compile_start(assignment_id):
     if not compile_queue.is_available():
         return jsonify(error="Compilation service unavailable"), 503
 
-    assignment_data = canvas_api_request(
+    assignment_data = canvas_get_cached(
         f"courses/{COURSE_ID}/assignments/{assignment_id}"
     )
     lab = get_lab_config_by_assignment_id(assignment_id)
@@ -1587,7 +2278,7 @@ def compile_start(assignment_id):
         netid=session.get("netid", ""),
         assignment_id=assignment_id,
         assignment_name=assignment_data["name"],
-        lab_config=json.dumps(lab),
+        lab_config=LAB_CONFIG_JSON[lab["template_dir"]],
         lab_name=lab["template_dir"],
         build_dir=build_dir,
         student_folder=student_folder,  # NEW: needed for PCB result copy-back
@@ -1597,7 +2288,7 @@ def compile_start(assignment_id):
 
 @app.route("/compile-status/<job_id>")
 def compile_status(job_id):
-    status = compile_queue.get_job_status(job_id)
+    status = compile_queue.get_job_status(job_id, with_result=True)
     if not status:
         return jsonify(error="Not found"), 404
 
@@ -1605,16 +2296,37 @@ def compile_status(job_id):
     if status.get("status") in ("complete", "failed") and "student_id" in session:
         result = status.get("result", {})
         compile_success = bool(result.get("success"))
-        job_meta = compile_queue.redis.hgetall(f"job:{job_id}")
-        if job_meta:
-            aid = job_meta.get("assignment_id", "")
-            lab = get_lab_config_by_assignment_id(aid)
-            if lab:
-                sf = get_submission_folder(session["student_id"], aid)
-                save_compile_status(sf, lab, compile_success)
+        # The status already holds every job field; no second HGETALL needed
+        aid = status.get("assignment_id", "")
+        lab = get_lab_config_by_assignment_id(aid)
+        if lab:
+            sf = get_submission_folder(session["student_id"], aid)
+            save_compile_status(sf, lab, compile_success)
 
     return jsonify(status)
 
+@app.route("/compile-events/<job_id>")
+def compile_events(job_id):
+    """
+    Server-sent events for one compile job. Each message carries the new
+    status; the page then fetches /compile-status once instead of polling
+    it every second.
+    """
+    if "student_id" not in session:
+        return jsonify(error="Not authenticated"), 403
+    if not compile_queue.is_available():
+        return jsonify(error="Compilation service unavailable"), 503
+
+    def stream():
+        for data in compile_queue.job_events(job_id):
+            # Comment lines keep proxies from closing an idle stream
+            yield f"data: {data}\n\n" if data is not None else ": keepalive\n\n"
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @app.route("/compile-cancel/<job_id>", methods=["POST"])
 def compile_cancel(job_id):
     if "student_id" not in session:
@@ -1630,6 +2342,31 @@ def compile_cancel(job_id):
 # ROUTES – ADMIN
 # =============================================================================
 
+# Several admins auto-refreshing at once share one Redis read per window.
+ADMIN_QUEUE_CACHE_TTL = 0.5  # seconds
+
+# (fetched_at monotonic seconds, jobs); replaced wholesale, never mutated.
+_admin_queue_cache = (0.0, [])
+
+
+def _cached_full_queue():
+    """compile_queue.get_full_queue(), reused for ADMIN_QUEUE_CACHE_TTL."""
+    global _admin_queue_cache
+    fetched_at, jobs = _admin_queue_cache
+    now = time.monotonic()
+    if now - fetched_at < ADMIN_QUEUE_CACHE_TTL:
+        return jobs
+    jobs = compile_queue.get_full_queue()
+    _admin_queue_cache = (now, jobs)
+    return jobs
+
+
+def _queue_counts(jobs):
+    """Return (queued_count, compiling_count) from one pass over the job list."""
+    counts = Counter(j.get("state") for j in jobs)
+    return counts["queued"], counts["compiling"]
+
+
 @app.route("/admin/login", methods=["GET", "POST"])
 def admin_login():
     if request.method == "POST":
@@ -1658,9 +2395,8 @@ def admin_compile_queue():
         flash("Compilation queue unavailable (Redis not connected)")
         jobs, queued_count, compiling_count = [], 0, 0
     else:
-        jobs = compile_queue.get_full_queue()
-        queued_count = len([j for j in jobs if j.get("state") == "queued"])
-        compiling_count = len([j for j in jobs if j.get("state") == "compiling"])
+        jobs = _cached_full_queue()
+        queued_count, compiling_count = _queue_counts(jobs)
 
     return render_template(
         "admin_queue.html",
@@ -1679,9 +2415,8 @@ def admin_queue_data():
     if not compile_queue.is_available():
         return jsonify(jobs=[], queued_count=0, compiling_count=0)
 
-    jobs = compile_queue.get_full_queue()
-    queued_count = len([j for j in jobs if j.get("state") == "queued"])
-    compiling_count = len([j for j in jobs if j.get("state") == "compiling"])
+    jobs = _cached_full_queue()
+    queued_count, compiling_count = _queue_counts(jobs)
 
     return jsonify(
         jobs=jobs,
@@ -1694,25 +2429,55 @@ def admin_queue_data():
 # ROUTES – DEBUG / HEALTH
 # =============================================================================
 
+# Queue counters for /health, refreshed in the background so liveness probes
+# never wait on Redis.  Replaced wholesale (atomic under the GIL), never mutated.
+HEALTH_POLL_INTERVAL = float(os.environ.get("HEALTH_POLL_INTERVAL", "2"))
+_health_snapshot = {
+    "redis_connected": compile_queue.is_available(),
+    "queued_jobs": 0,
+    "active_jobs": 0,
+    "checked_at": 0.0,
+}
+
+
+def _health_loop():
+    """Poll queue depth + active count in one pipelined round-trip."""
+    global _health_snapshot
+    while True:
+        redis_ok = compile_queue.is_available()
+        queue_len = 0
+        active_count = 0
+        if redis_ok:
+            try:
+                pipe = compile_queue.redis.pipeline(transaction=False)
+                pipe.llen("compile_queue")
+                pipe.scard("compile_active")
+                queue_len, active_count = pipe.execute()
+            except Exception:
+                pass
+        _health_snapshot = {
+            "redis_connected": redis_ok,
+            "queued_jobs": queue_len,
+            "active_jobs": active_count,
+            "checked_at": time.time(),
+        }
+        time.sleep(HEALTH_POLL_INTERVAL)
+
+
+threading.Thread(target=_health_loop, daemon=True).start()
+
+
 @app.route("/health")
 def health():
-    """Quick health check endpoint for monitoring."""
-    redis_ok = compile_queue.is_available()
-    queue_len = 0
-    active_count = 0
-
-    if redis_ok:
-        try:
-            queue_len = compile_queue.redis.llen("compile_queue")
-            active_count = compile_queue.redis.scard("compile_active")
-        except Exception:
-            pass
+    """Quick health check endpoint for monitoring (served from the cached snapshot)."""
+    snapshot = _health_snapshot
 
     return jsonify(
         status="ok",
-        redis_connected=redis_ok,
-        queued_jobs=queue_len,
-        active_jobs=active_count,
+        redis_connected=snapshot["redis_connected"],
+        queued_jobs=snapshot["queued_jobs"],
+        active_jobs=snapshot["active_jobs"],
+        checked_at=snapshot["checked_at"],
         roster_loaded=len(STUDENT_ROSTER),
         labs_loaded={aid: cfg["display_name"] for aid, cfg in LAB_CONFIGS.items()},
         submit_mode="online_upload" if SUBMIT_AS_UPLOAD else "comment_attachment",
@@ -11,6 +11,7 @@ Handles:
 Used by both the DALI web app (compile queue) and grading workflows.
 """
 
+import functools
 import os
 import platform
 import re
@@ -115,7 +116,19 @@ def create_makefile_for_lab(build_dir, source_files, output_name='firmware'):
         source_files: List of .c files to compile.
         output_name: Name of output file (default: firmware).
     """
-    c_files = [f for f in source_files if f.endswith('.c')]
+    c_files = tuple(f for f in source_files if f.endswith('.c'))
+    makefile_path = os.path.join(build_dir, 'Makefile')
+    with open(makefile_path, 'w') as f:
+        f.write(_render_makefile(c_files, output_name))
+    return makefile_path
+
+
+@functools.lru_cache(maxsize=64)
+def _render_makefile(c_files, output_name):
+    """
+    Makefile text for a tuple of .c files. Every build of a lab uses the same
+    few file lists, so each distinct Makefile is only formatted once.
+    """
     obj_files = [f.replace('.c', '.o') for f in c_files]
     cmd_file = f'{DEVICE_NAME.lower()}.cmd'
 
@@ -176,11 +189,7 @@ config:
 
 .PHONY: all clean config
 """
-
-    makefile_path = os.path.join(build_dir, 'Makefile')
-    with open(makefile_path, 'w') as f:
-        f.write(makefile_content)
-    return makefile_path
+    return makefile_content
 
 
 def ensure_linker_script(build_dir, template_dir):
@@ -11,11 +11,15 @@ Compilation Queue System
 import os
 import json
 import time
+import zlib
+import base64
+import hashlib
 import shutil
+import signal
 import logging
 import redis
 import subprocess
-from datetime import datetime
+from datetime import datetime, timezone
 from concurrent.futures import ThreadPoolExecutor
 import threading
 import uuid
@@ -31,24 +35,229 @@ from pcb_makefile_generator import (
     verify_pcb_toolchain,
 )
 
+# orjson when installed: compile results carry the full compiler output,
+# which can run to tens of KB. Both helpers deal in str, matching the
+# decode_responses client.
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
+# Results bigger than this (long compiler error cascades) are stored
+# zlib-compressed; compiler output shrinks several-fold. Base64 keeps the
+# value valid UTF-8 for the decode_responses client.
+RESULT_COMPRESS_MIN = 8 * 1024
+_ZLIB_PREFIX = "zlib:"
+
+
+def _result_key(job_id):
+    """
+    Results live beside the job hash, not in it, so HGETALLs of job
+    metadata (status polls, the admin queue) never carry compiler output.
+    """
+    return f"job_result:{job_id}"
+
+
+def _pack_result(result):
+    """Serialize a compile result for Redis, compressing large ones."""
+    raw = _json_dumps(result)
+    if len(raw) < RESULT_COMPRESS_MIN:
+        return raw
+    packed = base64.b64encode(zlib.compress(raw.encode())).decode("ascii")
+    return _ZLIB_PREFIX + packed
+
+
+def _unpack_result(value):
+    """Inverse of _pack_result; plain JSON from older jobs also works."""
+    if value.startswith(_ZLIB_PREFIX):
+        value = zlib.decompress(base64.b64decode(value[len(_ZLIB_PREFIX):]))
+    return _json_loads(value)
+
+
+def _heartbeat_epoch(value):
+    """
+    heartbeat_at is stored as epoch seconds so the reaper compares floats
+    rather than parsing dates. Jobs stamped before that change still carry
+    a naive UTC ISO string.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _move_result(src, dst):
+    """
+    Move a generated report out of a build directory that is about to be
+    deleted. A rename costs nothing on the same filesystem; otherwise
+    copyfile (sendfile on Linux) skips the metadata copy2 would also do.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
 TEMPLATE_FOLDER = os.environ.get("TEMPLATE_FOLDER", "template_files")
 
+# Each worker runs make -j(cpu_count // workers), so half the cores as
+# workers gives two compiler processes per build and about one per core
+# in total. COMPILE_WORKERS overrides this.
+DEFAULT_WORKERS = max(2, (os.cpu_count() or 4) // 2)
+
+# Redis connections per web process. Every request greenlet (page renders
+# through the Canvas cache, status polls, the health loop) borrows from it.
+DEFAULT_POOL_SIZE = 50
+
+
+def worker_pool_size(max_workers):
+    """
+    Connections a compile worker process can use at once: the dispatcher
+    blocked in BLMPOP, the heartbeat and reaper threads, and one per worker
+    thread for its cache lookup, start script and completion write.
+    """
+    return max_workers + 3
+
+
+# Job states after which nothing else is published for the job
+FINAL_STATUSES = frozenset({"complete", "failed", "cancelled"})
+
+# Move a popped job to "compiling" and return its fields, in one round trip.
+# Returns nil, and changes nothing, if the job was cancelled (or expired)
+# after it left the queue.
+# KEYS: job hash, compile_queue_order, compile_active
+# ARGV: job_id, ISO timestamp, events channel, event message, epoch heartbeat
+_START_JOB_LUA = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'queued' then
+    return nil
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[1])
+redis.call('HSET', KEYS[1], 'status', 'compiling',
+           'started_at', ARGV[2], 'heartbeat_at', ARGV[5])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return redis.call('HGETALL', KEYS[1])
+"""
+
 
-class CompilationQueue:
-    def __init__(self, redis_host="localhost", redis_port=6379):
+# Cap on the stdout / stderr kept from one make run. A runaway build can
+# print megabytes before the timeout; the first errors are what students
+# need, and anything past this is drained and dropped.
+OUTPUT_LIMIT = int(os.environ.get("COMPILE_OUTPUT_LIMIT", 256 * 1024))
+
+
+def _drain(stream, chunks):
+    """Read a pipe to EOF, keeping at most OUTPUT_LIMIT characters."""
+    kept = 0
+    truncated = False
+    for block in iter(lambda: stream.read(64 * 1024), ""):
+        room = OUTPUT_LIMIT - kept
+        if len(block) > room:
+            truncated = True
+            block = block[:room]
+        if block:
+            chunks.append(block)
+            kept += len(block)
+    if truncated:
+        chunks.append("\n[output truncated]\n")
+
+
+def _run_capped(args, timeout, env):
+    """
+    subprocess.run(capture_output=True, text=True, timeout=...) with bounded
+    output: the pipes are drained by two threads so memory per build stays
+    under 2 * OUTPUT_LIMIT however much the toolchain prints.
+    """
+    out, err = [], []
+    # make runs in its own session so a timeout can kill the compilers it
+    # started too; they hold the pipes open, and the readers wait for EOF
+    with subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env,
+        start_new_session=True,
+    ) as proc:
+        readers = [
+            threading.Thread(target=_drain, args=(proc.stdout, out), daemon=True),
+            threading.Thread(target=_drain, args=(proc.stderr, err), daemon=True),
+        ]
+        for t in readers:
+            t.start()
         try:
-            self.redis = redis.Redis(host=redis_host, port=redis_port, decode_responses=True)
-            self.redis.ping()
-        except redis.ConnectionError:
-            self.redis = None
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            raise
+        finally:
+            for t in readers:
+                t.join()
+    return subprocess.CompletedProcess(args, proc.returncode, "".join(out), "".join(err))
+
+
+def _build_digest(build_dir, *extra):
+    """Hash the names and contents of every file in build_dir, plus `extra`."""
+    h = hashlib.blake2b(digest_size=16)
+    for value in extra:
+        h.update(value.encode() + b"\0")
+    for entry in sorted(os.scandir(build_dir), key=lambda e: e.name):
+        if entry.is_file():
+            with open(entry.path, "rb") as f:
+                data = f.read()
+            h.update(f"{entry.name}\0{len(data)}\0".encode())
+            h.update(data)
+    return h.hexdigest()
 
+
+class CompilationQueue:
+    def __init__(self, redis_host="localhost", redis_port=6379, pool_size=None):
         self.executor = None
         self._stop = threading.Event()
 
+        # Build trees are deleted here so a worker slot frees up as soon as
+        # its result is written, not after a multi-MB rmtree
+        self._cleanup = ThreadPoolExecutor(max_workers=2, thread_name_prefix="build-cleanup")
+
+        # Jobs this process is compiling; one shared thread heartbeats them
+        self._running = set()
+        self._running_lock = threading.Lock()
+
         self.heartbeat_interval = int(os.environ.get("COMPILE_HEARTBEAT_INTERVAL", "2"))
         self.stale_seconds = int(os.environ.get("COMPILE_STALE_SECONDS", "30"))
         self.max_runtime = int(os.environ.get("COMPILE_MAX_RUNTIME", "60"))
-        self.max_workers = int(os.environ.get("COMPILE_WORKERS", "8"))
+        self.max_workers = int(os.environ.get("COMPILE_WORKERS", DEFAULT_WORKERS))
+        self.make_jobs = 1
+        # Every make run gets the same environment; build it once
+        self._subprocess_env = {**os.environ, "PATH": os.environ.get("PATH", "/usr/bin")}
+        self.cache_ttl = int(os.environ.get("COMPILE_CACHE_TTL", "3600"))
+        # Finished job hashes are only read by the page that started the job
+        self.job_ttl = int(os.environ.get("COMPILE_JOB_TTL", "86400"))
+
+        # One bounded pool shared by every thread or greenlet in the process;
+        # callers past the limit wait for a free connection instead of
+        # opening new sockets. The web app sizes it from REDIS_POOL_SIZE for
+        # its request greenlets; a compile worker passes worker_pool_size().
+        if pool_size is None:
+            pool_size = int(os.environ.get("REDIS_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self.pool = redis.BlockingConnectionPool(
+            host=redis_host,
+            port=redis_port,
+            max_connections=pool_size,
+            decode_responses=True,
+            socket_keepalive=True,
+        )
+        try:
+            self.redis = redis.Redis(connection_pool=self.pool)
+            self.redis.ping()
+        except redis.ConnectionError:
+            self.redis = None
+        self._events_redis = None
 
     def is_available(self):
         return self.redis is not None
@@ -64,23 +273,39 @@ class CompilationQueue:
         if max_workers is not None:
             self.max_workers = max_workers
 
-        # Verify embedded C toolchain
-        ok, msg = verify_toolchain()
+        # Split the CPUs between concurrent builds so each lab's objects
+        # compile in parallel without oversubscribing the host. PCB builds
+        # stay serial: their DRC rules share one sidecar .kicad_dru file.
+        self.make_jobs = max(1, (os.cpu_count() or 1) // self.max_workers)
+
+        # Verify both toolchains concurrently; each check is mostly waiting
+        # on subprocesses, so startup takes the slower of the two, not the sum
+        with ThreadPoolExecutor(max_workers=2) as tpe:
+            c_check = tpe.submit(verify_toolchain)
+            pcb_check = tpe.submit(verify_pcb_toolchain)
+            ok, msg = c_check.result()
+            ok_pcb, msg_pcb = pcb_check.result()
+
         if ok:
             logging.info("Embedded C toolchain verified: %s", msg)
         else:
             logging.warning("Embedded C toolchain not available: %s", msg)
 
-        # Verify PCB toolchain
-        ok_pcb, msg_pcb = verify_pcb_toolchain()
         if ok_pcb:
             logging.info("PCB toolchain verified: %s", msg_pcb)
         else:
             logging.warning("PCB toolchain not available: %s", msg_pcb)
 
+        # BLMPOP needs Redis 7; older servers get one BLPOP per job
+        version = self.redis.info("server").get("redis_version", "0")
+        self._use_blmpop = int(version.split(".")[0]) >= 7
+
+        self._start_job = self.redis.register_script(_START_JOB_LUA)
+
         self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
-        for _ in range(self.max_workers):
-            self.executor.submit(self._worker)
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        threading.Thread(target=self._dispatcher, daemon=True).start()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
         threading.Thread(target=self._reaper, daemon=True).start()
         logging.info("Started %d compile workers", self.max_workers)
 
@@ -96,47 +321,61 @@ class CompilationQueue:
             if not isinstance(val, str):
                 meta[key] = json.dumps(val)
 
+        # started_at, heartbeat_at and completed_at are written when they
+        # happen; readers treat a missing field as empty. The result is kept
+        # under its own job_result key (see _result_key).
         meta.update(
             job_id=job_id,
             status="queued",
             queued_at=datetime.utcnow().isoformat(),
-            started_at="",
-            completed_at="",
-            heartbeat_at="",
-            result="",
         )
-        self.redis.hset(f"job:{job_id}", mapping=meta)
-        self.redis.rpush("compile_queue", job_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(f"job:{job_id}", mapping=meta)
+        pipe.rpush("compile_queue", job_id)
+        pipe.zadd("compile_queue_order", {job_id: time.time()})
+        pipe.execute()
         return job_id
 
-    def get_job_status(self, job_id):
-        data = self.redis.hgetall(f"job:{job_id}")
+    def get_job_status(self, job_id, with_result=False):
+        """
+        Job fields plus queue position. The compiler output in `result` is
+        only decoded when `with_result` is set; otherwise it is left out.
+        """
+        # compile_queue_order mirrors compile_queue by submit time, so the
+        # position is a ZRANK fetched in the same round trip as the hash
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(f"job:{job_id}")
+        pipe.zrank("compile_queue_order", job_id)
+        if with_result:
+            pipe.get(_result_key(job_id))
+        data, rank, *stored = pipe.execute()
         if not data:
             return None
 
         # Add queue position if still queued
         if data.get("status") == "queued":
-            queue_items = self.redis.lrange("compile_queue", 0, -1)
-            try:
-                data["position"] = queue_items.index(job_id) + 1
-            except ValueError:
-                data["position"] = 0
+            data["position"] = rank + 1 if rank is not None else 0
             data["estimated_wait"] = data["position"] * 10  # rough estimate
 
-        # Deserialize result JSON if present
-        if data.get("result"):
-            try:
-                data["result"] = json.loads(data["result"])
-            except (json.JSONDecodeError, TypeError):
-                pass
+        # Jobs finished before results moved out of the hash still carry one
+        legacy = data.pop("result", None)
+        if with_result:
+            raw = stored[0] or legacy
+            if raw:
+                try:
+                    data["result"] = _unpack_result(raw)
+                except (ValueError, TypeError, zlib.error):
+                    data["result"] = raw
 
         return data
 
     def cancel_job(self, job_id, student_id=None):
         """Cancel a queued job. Only the submitting student can cancel."""
-        data = self.redis.hgetall(f"job:{job_id}")
-        if not data:
+        fields = ("status", "student_id", "build_dir")
+        values = self.redis.hmget(f"job:{job_id}", fields)
+        if values[0] is None:
             return {"success": False, "error": "Job not found"}
+        data = dict(zip(fields, values))
 
         if student_id and data.get("student_id") != student_id:
             return {"success": False, "error": "Not authorized to cancel this job"}
@@ -145,17 +384,25 @@ class CompilationQueue:
             return {"success": False, "error": f"Cannot cancel job in state: {data.get('status')}"}
 
         # Remove from queue
-        self.redis.lrem("compile_queue", 1, job_id)
-        self.redis.hset(f"job:{job_id}", mapping={
+        pipe = self.redis.pipeline()
+        pipe.lrem("compile_queue", 1, job_id)
+        pipe.zrem("compile_queue_order", job_id)
+        pipe.hset(f"job:{job_id}", mapping={
             "status": "cancelled",
             "completed_at": datetime.utcnow().isoformat(),
-            "result": json.dumps({"success": False, "error": "Cancelled by user"}),
         })
+        pipe.set(
+            _result_key(job_id),
+            _pack_result({"success": False, "error": "Cancelled by user"}),
+            ex=self.job_ttl,
+        )
+        pipe.expire(f"job:{job_id}", self.job_ttl)
+        self._publish_status(pipe, job_id, "cancelled")
+        pipe.execute()
 
         # Clean up build dir
         build_dir = data.get("build_dir", "")
-        if build_dir and os.path.isdir(build_dir):
-            shutil.rmtree(build_dir, ignore_errors=True)
+        self._discard_build_dir(build_dir)
 
         return {"success": True}
 
@@ -163,18 +410,29 @@ class CompilationQueue:
         """Return all active (queued + compiling) jobs for the admin dashboard."""
         jobs = []
 
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lrange("compile_queue", 0, -1)
+        pipe.smembers("compile_active")
+        queue_items, active_items = pipe.execute()
+        active_items = list(active_items)
+
+        # One round trip for every job hash instead of one per job
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id in queue_items:
+            pipe.hgetall(f"job:{job_id}")
+        for job_id in active_items:
+            pipe.hgetall(f"job:{job_id}")
+        results = pipe.execute()
+
         # Queued jobs (in order)
-        queue_items = self.redis.lrange("compile_queue", 0, -1)
-        for i, job_id in enumerate(queue_items):
-            data = self.redis.hgetall(f"job:{job_id}")
+        for i, data in enumerate(results[:len(queue_items)]):
             if data:
                 data["position"] = i + 1
                 data["state"] = "queued"
                 jobs.append(data)
 
         # Currently compiling jobs
-        for job_id in self.redis.smembers("compile_active"):
-            data = self.redis.hgetall(f"job:{job_id}")
+        for data in results[len(queue_items):]:
             if data:
                 data["state"] = "compiling"
                 data["position"] = 0
@@ -183,48 +441,142 @@ class CompilationQueue:
         return jobs
 
     # -------------------------------------------------------------------------
-    # WORKER LOOP
+    # STATUS EVENTS
     # -------------------------------------------------------------------------
 
-    def _worker(self):
-        while not self._stop.is_set():
-            item = self.redis.blpop("compile_queue", timeout=5)
-            if not item:
-                continue
+    def _discard_build_dir(self, build_dir):
+        """Delete a build directory in the background."""
+        if build_dir:
+            self._cleanup.submit(shutil.rmtree, build_dir, ignore_errors=True)
 
-            _, job_id = item
-            meta = self.redis.hgetall(f"job:{job_id}")
+    @staticmethod
+    def _publish_status(pipe, job_id, status):
+        """Queue a status-change message for job_events() subscribers."""
+        pipe.publish(f"job:{job_id}:events", json.dumps({"status": status}))
 
-            # Skip if cancelled while waiting
-            if meta.get("status") == "cancelled":
-                continue
+    def job_events(self, job_id, timeout=300, keepalive=15):
+        """
+        Yield JSON status messages for one job: its current status first,
+        then each change published by the workers. Yields None every
+        `keepalive` seconds while idle, and stops once the job reaches a
+        final state or `timeout` seconds have passed.
+
+        Subscribers sit idle for minutes, so they get their own unbounded
+        connection pool rather than holding slots in self.pool.
+        """
+        if self._events_redis is None:
+            self._events_redis = redis.Redis(connection_pool=redis.ConnectionPool(
+                **self.pool.connection_kwargs
+            ))
+        pubsub = self._events_redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before reading the current status so no change is missed
+            pubsub.subscribe(f"job:{job_id}:events")
+            status = self.redis.hget(f"job:{job_id}", "status")
+            if status is None:
+                return
+            yield json.dumps({"status": status})
+
+            deadline = time.monotonic() + timeout
+            while status not in FINAL_STATUSES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                msg = pubsub.get_message(timeout=min(remaining, keepalive))
+                if msg is None:
+                    yield None
+                    continue
+                status = json.loads(msg["data"]).get("status")
+                yield msg["data"]
+        finally:
+            pubsub.close()
 
-            self.redis.sadd("compile_active", job_id)
-            self.redis.hset(f"job:{job_id}", mapping={
-                "status": "compiling",
-                "started_at": datetime.utcnow().isoformat(),
-            })
+    # -------------------------------------------------------------------------
+    # WORKER LOOP
+    # -------------------------------------------------------------------------
 
-            # Start heartbeat thread
-            hb_stop = threading.Event()
-            threading.Thread(
-                target=self._heartbeat, args=(job_id, hb_stop), daemon=True
-            ).start()
+    def _dispatcher(self):
+        """
+        Pop queued jobs and hand them to the executor. One BLMPOP takes as
+        many jobs as there are idle workers, so a burst is drained in a
+        single round trip, and jobs never leave Redis before a worker is free.
+        """
+        while not self._stop.is_set():
+            if not self._slots.acquire(timeout=1):
+                continue
+            free = 1
+            while free < self.max_workers and self._slots.acquire(blocking=False):
+                free += 1
 
             try:
-                result = self._run_compilation(job_id, meta)
-            except Exception as e:
-                logging.exception("Compilation crashed for job %s", job_id)
-                result = {"success": False, "error": str(e), "stdout": "", "stderr": ""}
+                job_ids = self._pop_jobs(free)
+            except redis.RedisError:
+                logging.exception("Failed to pop from compile queue")
+                job_ids = []
+                self._stop.wait(1)
+
+            for job_id in job_ids:
+                self.executor.submit(self._process_job, job_id)
+            for _ in range(free - len(job_ids)):
+                self._slots.release()
+
+    def _pop_jobs(self, count):
+        """Block up to 5 s for queued job ids; at most `count` of them."""
+        if self._use_blmpop:
+            item = self.redis.blmpop(5, 1, "compile_queue", direction="LEFT", count=count)
+            return item[1] if item else []
+        item = self.redis.blpop("compile_queue", timeout=5)
+        return [item[1]] if item else []
+
+    def _process_job(self, job_id):
+        try:
+            self._run_job(job_id)
+        except Exception:
+            logging.exception("Worker failed handling job %s", job_id)
+        finally:
+            self._slots.release()
+
+    def _run_job(self, job_id):
+        # The first heartbeat is stamped here; the shared heartbeat thread
+        # takes over from the next tick
+        fields = self._start_job(
+            keys=[f"job:{job_id}", "compile_queue_order", "compile_active"],
+            args=[
+                job_id,
+                datetime.utcnow().isoformat(),
+                f"job:{job_id}:events",
+                json.dumps({"status": "compiling"}),
+                repr(time.time()),
+            ],
+        )
+
+        # Skip if cancelled while waiting
+        if not fields:
+            return
+        meta = dict(zip(fields[::2], fields[1::2]))
 
-            hb_stop.set()
+        with self._running_lock:
+            self._running.add(job_id)
+        try:
+            result = self._run_compilation(job_id, meta)
+        except Exception as e:
+            logging.exception("Compilation crashed for job %s", job_id)
+            result = {"success": False, "error": str(e), "stdout": "", "stderr": ""}
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
 
-            self.redis.hset(f"job:{job_id}", mapping={
-                "status": "complete" if result["success"] else "failed",
-                "completed_at": datetime.utcnow().isoformat(),
-                "result": json.dumps(result),
-            })
-            self.redis.srem("compile_active", job_id)
+        status = "complete" if result["success"] else "failed"
+        pipe = self.redis.pipeline()
+        pipe.hset(f"job:{job_id}", mapping={
+            "status": status,
+            "completed_at": datetime.utcnow().isoformat(),
+        })
+        pipe.set(_result_key(job_id), _pack_result(result), ex=self.job_ttl)
+        pipe.srem("compile_active", job_id)
+        pipe.expire(f"job:{job_id}", self.job_ttl)
+        self._publish_status(pipe, job_id, status)
+        pipe.execute()
 
     def _run_compilation(self, job_id, meta):
         """
@@ -263,22 +615,34 @@ class CompilationQueue:
             display_name = lab_config.get("display_name", "firmware")
             output_name = display_name.replace(" ", "_")
 
-            source_files = [f for f in os.listdir(build_dir) if f.endswith(".c")]
+            # Sorted so a lab's usual file set always yields the same
+            # (cached) Makefile and link order
+            source_files = sorted(
+                e.name for e in os.scandir(build_dir) if e.name.endswith(".c")
+            )
+
+            create_makefile_for_lab(build_dir, source_files, output_name)
+            ensure_linker_script(build_dir, template_dir)
+
+            # Identical sources for the same lab always build the same way,
+            # so a recompile of unchanged files reuses the earlier success.
+            # The digest is taken after the Makefile and linker script are
+            # written, so a change to the compiler flags misses the cache.
+            cache_key = f"compile_cache:{lab_name}:{_build_digest(build_dir, output_name)}"
+            cached = self.redis.get(cache_key)
+            if cached:
+                logging.info("Job %s: sources unchanged, reusing cached result", job_id)
+                return _unpack_result(cached)
 
             logging.info(
                 "Job %s: compiling %d source files in %s",
                 job_id, len(source_files), build_dir,
             )
 
-            create_makefile_for_lab(build_dir, source_files, output_name)
-            ensure_linker_script(build_dir, template_dir)
-
-            proc = subprocess.run(
-                ["make", "-C", build_dir, "all"],
-                capture_output=True,
-                text=True,
+            proc = _run_capped(
+                ["make", "-C", build_dir, f"-j{self.make_jobs}", "all"],
                 timeout=self.max_runtime,
-                env={**os.environ, "PATH": os.environ.get("PATH", "/usr/bin")},
+                env=self._subprocess_env,
             )
 
             success = proc.returncode == 0
@@ -290,12 +654,18 @@ class CompilationQueue:
                 proc.returncode,
             )
 
-            return {
+            result = {
                 "success": success,
                 "return_code": proc.returncode,
                 "stdout": proc.stdout,
                 "stderr": proc.stderr,
             }
+            # Only successes are cached: a failure can just as well come from
+            # the host (missing compiler, full disk, OOM kill) as from the
+            # sources, and replaying it would fail every identical submission
+            if success:
+                self.redis.set(cache_key, _pack_result(result), ex=self.cache_ttl)
+            return result
 
         except subprocess.TimeoutExpired:
             logging.warning("Job %s: compilation timed out after %ds", job_id, self.max_runtime)
@@ -314,8 +684,7 @@ class CompilationQueue:
                 "stderr": "",
             }
         finally:
-            if build_dir and os.path.isdir(build_dir):
-                shutil.rmtree(build_dir, ignore_errors=True)
+            self._discard_build_dir(build_dir)
 
     def _run_pcb_drc(self, job_id, meta, build_dir, lab_config):
         """
@@ -330,7 +699,9 @@ class CompilationQueue:
         """
         try:
             # Find the .kicad_pcb file
-            pcb_files = [f for f in os.listdir(build_dir) if f.endswith(".kicad_pcb")]
+            pcb_files = [
+                e.name for e in os.scandir(build_dir) if e.name.endswith(".kicad_pcb")
+            ]
             if not pcb_files:
                 return {
                     "success": False,
@@ -351,12 +722,10 @@ class CompilationQueue:
             create_makefile_for_pcb(build_dir, pcb_filename, dru_files)
 
             # Run make
-            proc = subprocess.run(
+            proc = _run_capped(
                 ["make", "-C", build_dir, "all"],
-                capture_output=True,
-                text=True,
                 timeout=self.max_runtime,
-                env={**os.environ, "PATH": os.environ.get("PATH", "/usr/bin")},
+                env=self._subprocess_env,
             )
 
             logging.info(
@@ -373,17 +742,13 @@ class CompilationQueue:
                     shutil.rmtree(results_dir)
                 os.makedirs(results_dir, exist_ok=True)
 
-                for fname in os.listdir(build_dir):
-                    if fname.startswith("drc_") and fname.endswith((".html", ".json")):
-                        shutil.copy2(
-                            os.path.join(build_dir, fname),
-                            os.path.join(results_dir, fname),
-                        )
-                    elif fname.startswith("preview_") and fname.endswith(".png"):
-                        shutil.copy2(
-                            os.path.join(build_dir, fname),
-                            os.path.join(results_dir, fname),
-                        )
+                # One scandir pass; DirEntry.path saves re-joining the source
+                for entry in os.scandir(build_dir):
+                    fname = entry.name
+                    if (
+                        fname.startswith("drc_") and fname.endswith((".html", ".json"))
+                    ) or (fname.startswith("preview_") and fname.endswith(".png")):
+                        _move_result(entry.path, os.path.join(results_dir, fname))
 
             # For PCB, "success" means the pipeline ran — individual DRC
             # pass/fail is in the reports. We report success=True unless
@@ -412,48 +777,96 @@ class CompilationQueue:
                 "stderr": "",
             }
         finally:
-            if build_dir and os.path.isdir(build_dir):
-                shutil.rmtree(build_dir, ignore_errors=True)
+            self._discard_build_dir(build_dir)
 
     # -------------------------------------------------------------------------
     # HEARTBEAT + REAPER
     # -------------------------------------------------------------------------
 
-    def _heartbeat(self, job_id, stop):
-        while not stop.is_set():
-            self.redis.hset(f"job:{job_id}", "heartbeat_at", datetime.utcnow().isoformat())
-            stop.wait(self.heartbeat_interval)
+    def _heartbeat(self):
+        """Stamp heartbeat_at on every job this process is running, in one round trip."""
+        while not self._stop.is_set():
+            with self._running_lock:
+                running = list(self._running)
+            if running:
+                now = repr(time.time())
+                pipe = self.redis.pipeline(transaction=False)
+                for job_id in running:
+                    pipe.hset(f"job:{job_id}", "heartbeat_at", now)
+                try:
+                    pipe.execute()
+                except redis.RedisError:
+                    logging.exception("Heartbeat write failed")
+            self._stop.wait(self.heartbeat_interval)
 
     def _reaper(self):
+        off_list = set()
         while not self._stop.is_set():
-            now = datetime.utcnow()
-            for job_id in self.redis.smembers("compile_active"):
-                meta = self.redis.hgetall(f"job:{job_id}")
-                hb = meta.get("heartbeat_at")
+            off_list = self._prune_queue_order(off_list)
+            now = time.time()
+            active = list(self.redis.smembers("compile_active"))
+            # Only heartbeat_at is needed; the hash also carries the job metadata
+            pipe = self.redis.pipeline(transaction=False)
+            for job_id in active:
+                pipe.hget(f"job:{job_id}", "heartbeat_at")
+            for job_id, hb in zip(active, pipe.execute()):
                 if not hb:
                     self._fail(job_id, "Missing heartbeat")
                     continue
-                dt = datetime.fromisoformat(hb)
-                if (now - dt).total_seconds() > self.stale_seconds:
+                if now - _heartbeat_epoch(hb) > self.stale_seconds:
                     self._fail(job_id, "Stale heartbeat — worker may have crashed")
             time.sleep(5)
 
+    def _prune_queue_order(self, suspects):
+        """
+        Drop compile_queue_order members that have left compile_queue, so
+        they no longer count towards later jobs' positions. A finished,
+        cancelled or expired job is removed at once. One still "queued" was
+        popped and is about to start, unless its worker died first; it is
+        failed only if it was already off the list on the previous pass
+        (`suspects`). Returns this pass's suspects.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrange("compile_queue_order", 0, -1)
+        pipe.lrange("compile_queue", 0, -1)
+        ordered, listed = pipe.execute()
+        listed = set(listed)
+        missing = [job_id for job_id in ordered if job_id not in listed]
+        if not missing:
+            return set()
+
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id in missing:
+            pipe.hget(f"job:{job_id}", "status")
+        popped = set()
+        for job_id, status in zip(missing, pipe.execute()):
+            if status != "queued":
+                self.redis.zrem("compile_queue_order", job_id)
+            elif job_id in suspects:
+                self._fail(job_id, "Job lost before it started — worker may have crashed")
+            else:
+                popped.add(job_id)
+        return popped
+
     def _fail(self, job_id, reason):
         logging.warning("Reaper failing job %s: %s", job_id, reason)
 
-        meta = self.redis.hgetall(f"job:{job_id}")
-        build_dir = meta.get("build_dir", "")
-        if build_dir and os.path.isdir(build_dir):
-            shutil.rmtree(build_dir, ignore_errors=True)
+        build_dir = self.redis.hget(f"job:{job_id}", "build_dir")
+        self._discard_build_dir(build_dir)
 
-        self.redis.hset(f"job:{job_id}", mapping={
+        pipe = self.redis.pipeline()
+        pipe.hset(f"job:{job_id}", mapping={
             "status": "failed",
             "completed_at": datetime.utcnow().isoformat(),
-            "result": json.dumps({
-                "success": False,
-                "error": reason,
-                "stdout": "",
-                "stderr": "",
-            }),
         })
-        self.redis.srem("compile_active", job_id)
+        pipe.set(_result_key(job_id), _pack_result({
+            "success": False,
+            "error": reason,
+            "stdout": "",
+            "stderr": "",
+        }), ex=self.job_ttl)
+        pipe.srem("compile_active", job_id)
+        pipe.zrem("compile_queue_order", job_id)
+        pipe.expire(f"job:{job_id}", self.job_ttl)
+        self._publish_status(pipe, job_id, "failed")
+        pipe.execute()
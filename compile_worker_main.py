@@ -10,7 +10,7 @@ It connects to Redis and processes compilation jobs from the queue.
 import os
 import time
 import logging
-from compile_queue import CompilationQueue
+from compile_queue import CompilationQueue, DEFAULT_WORKERS, worker_pool_size
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,11 +20,15 @@ logging.basicConfig(
 
 redis_host = os.environ.get("REDIS_HOST", "localhost")
 redis_port = int(os.environ.get("REDIS_PORT", "6379"))
-max_workers = int(os.environ.get("COMPILE_WORKERS", "8"))
+max_workers = int(os.environ.get("COMPILE_WORKERS", DEFAULT_WORKERS))
 
 logging.info("Starting compile worker (redis=%s:%d, workers=%d)", redis_host, redis_port, max_workers)
 
-queue = CompilationQueue(redis_host=redis_host, redis_port=redis_port)
+queue = CompilationQueue(
+    redis_host=redis_host,
+    redis_port=redis_port,
+    pool_size=worker_pool_size(max_workers),
+)
 queue.start_workers(max_workers=max_workers)
 
 # Keep main thread alive
@@ -0,0 +1,382 @@
+"""
+Tests for the web app, with fakeredis standing in for Redis and no Canvas
+or CAS traffic.
+
+    pip install pytest fakeredis python-cas
+    python -m pytest test_app_complete.py
+
+The app reads its config from the working directory, so the fixture below
+imports it from a scratch copy of template_files.
+"""
+
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("cas")
+fakeredis = pytest.importorskip("fakeredis")
+import redis
+from werkzeug.datastructures import FileStorage
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    work = tmp_path_factory.mktemp("dali")
+    shutil.copytree(os.path.join(REPO, "template_files"), work / "template_files")
+    (work / "student_passwords.csv").write_text(
+        "netid,name,canvas_id,password\nab1,Alice,111,pw1\n"
+    )
+    env = {
+        "FLASK_SECRET_KEY": "test",
+        "CANVAS_API_TOKEN": "test",
+        "COURSE_ID": "1",
+        "ADMIN_PASSWORD": "test",
+        "ROSTER_CSV_PATH": "student_passwords.csv",
+        # Port 1 refuses connections, so the app starts without Redis
+        "REDIS_PORT": "1",
+    }
+    old_cwd, old_env = os.getcwd(), {k: os.environ.get(k) for k in env}
+    os.chdir(work)
+    os.environ.update(env)
+    sys.path.insert(0, REPO)
+    try:
+        sys.modules.pop("app_complete", None)
+        yield importlib.import_module("app_complete")
+    finally:
+        os.chdir(old_cwd)
+        for k, v in old_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+@pytest.fixture
+def app(app_module, monkeypatch):
+    """The app module with a fresh fakeredis behind compile_queue."""
+    monkeypatch.setattr(app_module.compile_queue, "redis", fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(app_module.compile_queue, "is_available", lambda: True)
+    app_module._canvas_get_cache.clear()
+    return app_module
+
+
+@pytest.fixture
+def canvas_calls(app, monkeypatch):
+    calls = []
+
+    def fake_request(endpoint, method="GET", data=None, files=None):
+        calls.append((method, endpoint))
+        return {"endpoint": endpoint}
+    monkeypatch.setattr(app, "canvas_api_request", fake_request)
+    return calls
+
+
+def _embedded_lab(app):
+    """(assignment_id, config) of an embedded C lab that expects a writeup."""
+    return next(
+        (aid, cfg) for aid, cfg in app.LAB_CONFIGS.items()
+        if cfg.get("type", "embedded_c") == "embedded_c" and cfg.get("writeup_files")
+    )
+
+
+class _BrokenRedis:
+    """Accepts commands, then fails every round trip like a dropped server."""
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def __getattr__(self, name):
+        return lambda *a, **k: self
+
+    def execute(self):
+        raise redis.ConnectionError("Connection refused")
+
+    def set(self, *a, **k):
+        raise redis.ConnectionError("Connection refused")
+
+
+# =============================================================================
+# CANVAS CACHE
+# =============================================================================
+
+def test_canvas_cache_is_shared_through_redis(app, canvas_calls):
+    first = app.canvas_get_cached("courses/1/assignments")
+    app._canvas_get_cache.clear()  # as seen from another gunicorn worker
+    second = app.canvas_get_cached("courses/1/assignments")
+
+    assert first == second == {"endpoint": "courses/1/assignments"}
+    assert len(canvas_calls) == 1
+
+
+def test_canvas_cache_survives_redis_outage(app, canvas_calls, monkeypatch):
+    # The health flag still says Redis is up; the connection is gone
+    monkeypatch.setattr(app.compile_queue, "redis", _BrokenRedis())
+
+    first = app.canvas_get_cached("courses/1/assignments")
+    second = app.canvas_get_cached("courses/1/assignments")
+
+    assert first == second == {"endpoint": "courses/1/assignments"}
+    assert len(canvas_calls) == 1  # second hit served in-process
+
+
+# =============================================================================
+# UPLOADS
+# =============================================================================
+
+class _AbortedStream(io.BytesIO):
+    """Yields some data, then fails like a client that hung up."""
+
+    def read(self, size=-1):
+        if self.tell():
+            raise OSError("client disconnected")
+        return super().read(4)
+
+
+def test_save_upload_replaces_file(app, tmp_path):
+    dest = tmp_path / "lab3.c"
+    dest.write_bytes(b"old")
+    app._save_upload(FileStorage(io.BytesIO(b"new")), str(dest))
+    assert dest.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["lab3.c"]
+
+
+def test_aborted_upload_leaves_no_temp_file(app, tmp_path):
+    dest = tmp_path / "lab3.c"
+    dest.write_bytes(b"old")
+    with pytest.raises(OSError):
+        app._save_upload(FileStorage(_AbortedStream(b"partial upload")), str(dest))
+    assert dest.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["lab3.c"]
+
+
+def test_failed_rename_leaves_no_temp_file(app, tmp_path, monkeypatch):
+    def full_disk(src, dst):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(app.os, "replace", full_disk)
+    with pytest.raises(OSError):
+        app._save_upload(FileStorage(io.BytesIO(b"new")), str(tmp_path / "lab3.c"))
+    assert os.listdir(tmp_path) == []
+
+
+# =============================================================================
+# FILE FINGERPRINT
+# =============================================================================
+
+def _age(path, seconds):
+    """Backdate a folder's mtime so the racy-mtime guard no longer applies."""
+    t = time.time_ns() - seconds * 1_000_000_000
+    os.utime(path, ns=(t, t))
+
+
+@pytest.fixture
+def lab_folder(app, tmp_path):
+    _, lab = _embedded_lab(app)
+    folder = tmp_path / "student"
+    folder.mkdir()
+    (folder / lab["code_files"][0]).write_text("int a;")
+    app._fingerprint_cache.clear()
+    return str(folder), lab
+
+
+def test_fingerprint_tracks_uploads_extras_and_exclusions(app, lab_folder):
+    folder, lab = lab_folder
+    code_file = lab["code_files"][0]
+    seen = {app.compute_file_fingerprint(folder, lab)}
+
+    with open(os.path.join(folder, code_file), "w") as f:
+        f.write("int a; int b;")
+    seen.add(app.compute_file_fingerprint(folder, lab))
+
+    with open(os.path.join(folder, "helpers.c"), "w") as f:
+        f.write("int h;")
+    seen.add(app.compute_file_fingerprint(folder, lab))
+
+    os.rename(os.path.join(folder, code_file), os.path.join(folder, code_file + ".excluded"))
+    seen.add(app.compute_file_fingerprint(folder, lab))
+
+    assert len(seen) == 4
+
+
+def _baseline_fingerprint(folder, lab):
+    """The fingerprint statuses were saved with before fingerprint_version."""
+    h = hashlib.sha256()
+    for fname in lab["code_files"]:
+        path = os.path.join(folder, fname)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            h.update(f"{fname}:uploaded:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        else:
+            h.update(f"{fname}:template\n".encode())
+    return h.hexdigest()[:16]
+
+
+def test_saved_status_matches_current_files(app, lab_folder):
+    folder, lab = lab_folder
+    app.save_compile_status(folder, lab, True)
+    assert app.get_compile_status(folder, lab) == "passed"
+
+
+def test_status_saved_before_upgrade_still_counts(app, lab_folder):
+    folder, lab = lab_folder
+    with open(os.path.join(folder, app.COMPILE_STATUS_FILE), "w") as f:
+        json.dump({
+            "success": True,
+            "fingerprint": _baseline_fingerprint(folder, lab),
+            "timestamp": "2026-01-01T00:00:00",
+        }, f)
+    assert app.get_compile_status(folder, lab) == "passed"
+
+    with open(os.path.join(folder, lab["code_files"][0]), "w") as f:
+        f.write("int a; int b;")
+    assert app.get_compile_status(folder, lab) == "untested"
+
+
+def test_fingerprint_cached_while_folder_unchanged(app, lab_folder, monkeypatch):
+    folder, lab = lab_folder
+    _age(folder, 10)
+    first = app.current_file_fingerprint(folder, lab)
+    assert folder in app._fingerprint_cache
+
+    def must_not_rescan(*args):
+        raise AssertionError("fingerprint recomputed for an unchanged folder")
+    monkeypatch.setattr(app, "compute_file_fingerprint", must_not_rescan)
+    assert app.current_file_fingerprint(folder, lab) == first
+
+
+def test_fingerprint_not_cached_for_recent_folder_mtime(app, lab_folder):
+    folder, lab = lab_folder
+    # Changed within the last 2 s: a second change in the same timestamp
+    # tick could leave the mtime as it is, so nothing is cached yet
+    first = app.current_file_fingerprint(folder, lab)
+    assert folder not in app._fingerprint_cache
+
+    # Rewrite in place without touching the folder mtime, as such a change would
+    mtime_ns = os.stat(folder).st_mtime_ns
+    with open(os.path.join(folder, lab["code_files"][0]), "w") as f:
+        f.write("int changed_in_place;")
+    os.utime(folder, ns=(mtime_ns, mtime_ns))
+
+    assert app.current_file_fingerprint(folder, lab) != first
+
+
+def test_save_upload_invalidates_cached_fingerprint(app, lab_folder):
+    folder, lab = lab_folder
+    _age(folder, 10)
+    first = app.current_file_fingerprint(folder, lab)
+
+    dest = os.path.join(folder, lab["code_files"][0])
+    app._save_upload(FileStorage(io.BytesIO(b"int new;")), dest)
+
+    assert app.current_file_fingerprint(folder, lab) != first
+
+
+# =============================================================================
+# BUILD DIRECTORY
+# =============================================================================
+
+def test_directory_named_like_code_file_is_not_an_upload(app):
+    aid, lab = _embedded_lab(app)
+    folder = app.get_submission_folder("dirs", aid)
+    code_file = next(
+        f for f in lab["code_files"]
+        if f in app.LAB_TEMPLATE_FILES[lab["template_dir"]]
+    )
+    os.makedirs(os.path.join(folder, code_file))
+    os.makedirs(os.path.join(folder, "helpers.c"))
+
+    build_dir = app.prepare_build_directory(folder, lab)
+    try:
+        # The template copy is used; the stray directories are ignored
+        assert os.path.isfile(os.path.join(build_dir, code_file))
+        assert not os.path.exists(os.path.join(build_dir, "helpers.c"))
+    finally:
+        shutil.rmtree(build_dir)
+
+
+def test_every_build_runs_under_build_folder(app):
+    for aid, lab in app.LAB_CONFIGS.items():
+        build_dir = app.prepare_build_directory(app.get_submission_folder("111", aid), lab)
+        try:
+            assert os.path.dirname(build_dir) == app.BUILD_FOLDER, lab["template_dir"]
+        finally:
+            shutil.rmtree(build_dir)
+
+
+# =============================================================================
+# BACKGROUND SUBMISSION
+# =============================================================================
+
+@pytest.fixture
+def student(app):
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["student_id"] = "111"
+        sess["netid"] = "ab1"
+    return client
+
+
+def _submit(app, client, monkeypatch, outcome, run_upload=True):
+    """POST /submit; the background upload runs inline unless run_upload is False."""
+    aid, lab = _embedded_lab(app)
+    folder = app.get_submission_folder("111", aid)
+    with open(os.path.join(folder, lab["writeup_files"][0]), "wb") as f:
+        f.write(b"%PDF-1.4")
+    monkeypatch.setattr(app, "_do_submission", lambda *args: outcome)
+    monkeypatch.setattr(
+        app.submit_pool, "submit",
+        (lambda fn, *args: fn(*args)) if run_upload else (lambda *args: None),
+    )
+    return client.post(f"/submit/{aid}")
+
+
+def test_submit_returns_202_and_reports_outcome(app, student, monkeypatch):
+    resp = _submit(app, student, monkeypatch, {"success": True, "message": "Submitted"})
+    assert resp.status_code == 202
+    body = resp.get_json()
+    key = f"submission:{body['submission_id']}"
+    assert body["poll_timeout"] == app.SUBMISSION_PENDING_TTL
+
+    status = student.get(f"/submission-status/{body['submission_id']}").get_json()
+    assert status == {"status": "complete", "success": True, "message": "Submitted", "error": ""}
+    assert app.compile_queue.redis.ttl(key) > app.SUBMISSION_PENDING_TTL
+
+
+def test_submit_failure_is_reported(app, student, monkeypatch):
+    resp = _submit(app, student, monkeypatch, {"success": False, "error": "Canvas said no"})
+    submission_id = resp.get_json()["submission_id"]
+
+    status = student.get(f"/submission-status/{submission_id}").get_json()
+    assert status["status"] == "failed" and status["error"] == "Canvas said no"
+
+
+def test_lost_submission_expires_quickly(app, student, monkeypatch):
+    # The worker running the upload died: the outcome is never written
+    resp = _submit(app, student, monkeypatch, {"success": True}, run_upload=False)
+    submission_id = resp.get_json()["submission_id"]
+
+    key = f"submission:{submission_id}"
+    assert 0 < app.compile_queue.redis.ttl(key) <= app.SUBMISSION_PENDING_TTL
+    assert student.get(f"/submission-status/{submission_id}").get_json()["status"] == "uploading"
+
+    app.compile_queue.redis.delete(key)  # the TTL runs out
+    assert student.get(f"/submission-status/{submission_id}").status_code == 404
+
+
+def test_submission_status_is_private(app, student, monkeypatch):
+    resp = _submit(app, student, monkeypatch, {"success": True, "message": "ok"})
+    submission_id = resp.get_json()["submission_id"]
+
+    other = app.app.test_client()
+    with other.session_transaction() as sess:
+        sess["student_id"] = "222"
+    assert other.get(f"/submission-status/{submission_id}").status_code == 404
@@ -0,0 +1,267 @@
+"""
+Tests for the Redis compile queue, run against fakeredis, so no Redis
+server is needed.
+
+    pip install pytest fakeredis
+    python -m pytest test_compile_queue.py
+"""
+
+import os
+import time
+import threading
+import subprocess
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import compile_queue
+from compile_queue import CompilationQueue
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    # Port 1 refuses connections, so the real client is dropped at once
+    q = CompilationQueue(redis_host="localhost", redis_port=1)
+    q.redis = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(compile_queue, "ensure_linker_script", lambda *a: True)
+    return q
+
+
+def _use_makefile(monkeypatch, recipe):
+    """
+    Replace the generated lab Makefile with one running `recipe`, so make
+    runs for real without the TI toolchain.
+    """
+    def write(build_dir, source_files, output_name):
+        with open(os.path.join(build_dir, "Makefile"), "w") as f:
+            f.write(f"all:\n\t{recipe}\n")
+    monkeypatch.setattr(compile_queue, "create_makefile_for_lab", write)
+
+
+def _count_make_runs(monkeypatch):
+    runs = []
+    real = compile_queue._run_capped
+
+    def counting(*args, **kwargs):
+        runs.append(args)
+        return real(*args, **kwargs)
+    monkeypatch.setattr(compile_queue, "_run_capped", counting)
+    return runs
+
+
+def _build(queue, tmp_path, name, source="int main(void) { return 0; }\n"):
+    build_dir = tmp_path / name
+    build_dir.mkdir()
+    (build_dir / "lab3.c").write_text(source)
+    return queue._run_embedded_c(
+        name, {"lab_name": "lab3"}, str(build_dir), {"display_name": "Lab 3"}
+    )
+
+
+def _cache_keys(queue):
+    return queue.redis.keys("compile_cache:*")
+
+
+# =============================================================================
+# COMPILE CACHE
+# =============================================================================
+
+def test_successful_build_is_reused(queue, tmp_path, monkeypatch):
+    _use_makefile(monkeypatch, "@echo built")
+    runs = _count_make_runs(monkeypatch)
+
+    first = _build(queue, tmp_path, "a")
+    second = _build(queue, tmp_path, "b")
+
+    assert first["success"] and second == first
+    assert len(runs) == 1
+    assert len(_cache_keys(queue)) == 1
+
+
+def test_changed_sources_are_rebuilt(queue, tmp_path, monkeypatch):
+    _use_makefile(monkeypatch, "@echo built")
+    runs = _count_make_runs(monkeypatch)
+
+    _build(queue, tmp_path, "a", "int x;\n")
+    _build(queue, tmp_path, "b", "int y;\n")
+
+    assert len(runs) == 2
+    assert len(_cache_keys(queue)) == 2
+
+
+def test_changed_makefile_is_rebuilt(queue, tmp_path, monkeypatch):
+    # Same sources, new compiler flags
+    _use_makefile(monkeypatch, "@echo built -O2")
+    runs = _count_make_runs(monkeypatch)
+    _build(queue, tmp_path, "a")
+
+    _use_makefile(monkeypatch, "@echo built -O3")
+    _build(queue, tmp_path, "b")
+
+    assert len(runs) == 2
+    assert len(_cache_keys(queue)) == 2
+
+
+def test_missing_compiler_is_not_cached(queue, tmp_path, monkeypatch):
+    # make exits 2 and reports "Error 127" when the compiler is not installed
+    _use_makefile(monkeypatch, "dali-no-such-compiler -c lab3.c")
+    runs = _count_make_runs(monkeypatch)
+
+    first = _build(queue, tmp_path, "a")
+    second = _build(queue, tmp_path, "b")
+
+    assert not first["success"] and first["return_code"] == 2
+    assert "Error 127" in first["stderr"]
+    assert not second["success"]
+    assert len(runs) == 2
+    assert _cache_keys(queue) == []
+
+
+def test_killed_compiler_is_not_cached(queue, tmp_path, monkeypatch):
+    _use_makefile(monkeypatch, "@kill -9 $$$$")
+
+    result = _build(queue, tmp_path, "a")
+
+    assert not result["success"]
+    assert _cache_keys(queue) == []
+
+
+def test_compile_errors_are_not_cached(queue, tmp_path, monkeypatch):
+    _use_makefile(monkeypatch, "@echo 'lab3.c:1:1: error: expected ;' >&2; exit 1")
+    runs = _count_make_runs(monkeypatch)
+
+    _build(queue, tmp_path, "a")
+    _build(queue, tmp_path, "b")
+
+    assert len(runs) == 2
+    assert _cache_keys(queue) == []
+
+
+def test_timeout_is_not_cached(queue, tmp_path, monkeypatch):
+    _use_makefile(monkeypatch, "@sleep 5")
+    queue.max_runtime = 0.2
+
+    result = _build(queue, tmp_path, "a")
+
+    assert "timed out" in result["error"]
+    assert _cache_keys(queue) == []
+
+
+# =============================================================================
+# OUTPUT CAPTURE
+# =============================================================================
+
+def test_run_capped_truncates_long_output(monkeypatch):
+    monkeypatch.setattr(compile_queue, "OUTPUT_LIMIT", 100)
+    proc = compile_queue._run_capped(
+        ["sh", "-c", "yes x | head -c 10000; echo err >&2; exit 3"], 10, None
+    )
+    assert proc.returncode == 3
+    assert proc.stdout.startswith("x\n" * 50)
+    assert proc.stdout.endswith("[output truncated]\n")
+    assert proc.stderr == "err\n"
+
+
+def test_run_capped_timeout_kills_children():
+    # The sleep outlives the shell unless the whole process group is killed
+    start = time.time()
+    with pytest.raises(subprocess.TimeoutExpired):
+        compile_queue._run_capped(["sh", "-c", "sleep 30; true"], 0.2, None)
+    assert time.time() - start < 5
+
+
+# =============================================================================
+# CONNECTION POOL
+# =============================================================================
+
+def test_web_pool_is_not_sized_from_worker_count(monkeypatch):
+    monkeypatch.delenv("REDIS_POOL_SIZE", raising=False)
+    monkeypatch.setenv("COMPILE_WORKERS", "2")
+    q = CompilationQueue(redis_host="localhost", redis_port=1)
+    assert q.pool.max_connections == compile_queue.DEFAULT_POOL_SIZE
+
+    monkeypatch.setenv("REDIS_POOL_SIZE", "80")
+    q = CompilationQueue(redis_host="localhost", redis_port=1)
+    assert q.pool.max_connections == 80
+
+
+def test_worker_pool_covers_every_thread():
+    q = CompilationQueue(
+        redis_host="localhost", redis_port=1,
+        pool_size=compile_queue.worker_pool_size(4),
+    )
+    # dispatcher + heartbeat + reaper + one per worker
+    assert q.pool.max_connections == 4 + 3
+
+
+# =============================================================================
+# JOB LIFECYCLE
+# =============================================================================
+
+def test_queue_position_and_cancel(queue):
+    first = queue.submit_job(student_id="s1", lab_name="lab3")
+    second = queue.submit_job(student_id="s2", lab_name="lab3")
+
+    assert queue.get_job_status(second)["position"] == 2
+    assert queue.cancel_job(first, "s2")["success"] is False
+    assert queue.cancel_job(first, "s1")["success"] is True
+
+    assert queue.get_job_status(second)["position"] == 1
+    cancelled = queue.get_job_status(first, with_result=True)
+    assert cancelled["status"] == "cancelled"
+    assert cancelled["result"]["error"] == "Cancelled by user"
+    # The result is kept beside the hash, and only returned on request
+    assert "result" not in queue.redis.hgetall(f"job:{first}")
+    assert "result" not in queue.get_job_status(first)
+
+
+def test_reaper_fails_stale_jobs(queue):
+    queue.redis.sadd("compile_active", "stale", "legacy", "live")
+    queue.redis.hset("job:stale", mapping={"status": "compiling", "heartbeat_at": "0"})
+    # Stamped by a worker from before heartbeats were stored as epoch seconds
+    queue.redis.hset("job:legacy", mapping={
+        "status": "compiling", "heartbeat_at": "2020-01-01T00:00:00",
+    })
+    queue.redis.hset("job:live", mapping={
+        "status": "compiling", "heartbeat_at": repr(time.time()),
+    })
+
+    reaper = threading.Thread(target=queue._reaper, daemon=True)
+    reaper.start()
+    deadline = time.time() + 5
+    while queue.redis.scard("compile_active") > 1 and time.time() < deadline:
+        time.sleep(0.05)
+    queue._stop.set()
+
+    assert queue.redis.smembers("compile_active") == {"live"}
+    for job_id in ("stale", "legacy"):
+        assert queue.get_job_status(job_id)["status"] == "failed"
+        assert queue.redis.ttl(f"job:{job_id}") > 0
+    assert queue.get_job_status("live")["status"] == "compiling"
+
+
+def test_lost_jobs_leave_the_queue_order(queue):
+    lost = queue.submit_job(student_id="s1", lab_name="lab3")
+    waiting = queue.submit_job(student_id="s2", lab_name="lab3")
+    # Popped by a worker that died before starting it
+    queue.redis.lpop("compile_queue")
+    # Left behind after its hash expired
+    queue.redis.zadd("compile_queue_order", {"expired": 0})
+    assert queue.get_job_status(waiting)["position"] == 3
+
+    # The first pass can't tell a lost job from one about to start
+    suspects = queue._prune_queue_order(set())
+    assert suspects == {lost}
+    assert queue.get_job_status(waiting)["position"] == 2
+
+    assert queue._prune_queue_order(suspects) == set()
+    assert queue.get_job_status(waiting)["position"] == 1
+    assert queue.get_job_status(lost)["status"] == "failed"
+
+
+def test_large_results_round_trip():
+    result = {"success": False, "stderr": "warning: x\n" * 5000}
+    packed = compile_queue._pack_result(result)
+    assert packed.startswith("zlib:") and len(packed) < 2000
+    assert compile_queue._unpack_result(packed) == result